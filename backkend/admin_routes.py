@@ -0,0 +1,39 @@
+# Admin Diagnostics Routes (mounted only with DIAGNOSTICS_ENABLED=true)
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from fastapi.responses import PlainTextResponse
+from auth import get_admin_user
+from diagnostics import PROFILE_MAX_SECONDS, ProfilerBusy, format_folded, memory_report, profiler
+from http_responses import FastJSONResponse
+from routes import loaded_rag_service
+
+router = APIRouter(prefix="/api/admin", tags=["Admin Diagnostics"], dependencies=[Depends(get_admin_user)])
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    include_idle: bool = False
+):
+    """
+    Sample the stacks of all threads (event loop and executor threads) for `seconds`
+    and return them in folded format, e.g. `flamegraph.pl profile.txt > profile.svg`
+    or drop the file into speedscope.app
+    """
+    try:
+        stacks, samples = await asyncio.to_thread(profiler.sample, seconds, interval_ms / 1000, include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(
+        format_folded(stacks),
+        headers={"X-Profile-Samples": str(samples), "X-Profile-Seconds": str(seconds)}
+    )
+
+@router.get("/memory", response_class=FastJSONResponse)
+async def memory():
+    """
+    Memory breakdown: process RSS, GC, embedding model, vector store,
+    conversation memories and caches (plus top allocation sites when the
+    process runs with PYTHONTRACEMALLOC)
+    """
+    return await asyncio.to_thread(memory_report, loaded_rag_service())
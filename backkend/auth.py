@@ -18,6 +18,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Security scheme
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -83,6 +84,17 @@ async def get_current_active_user(current_user: dict = Depends(get_current_user)
     """Get current active user"""
     return current_user
 
+async def get_optional_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[str]:
+    """User ID from a valid token if one was sent, otherwise None.
+    
+    Only decodes the JWT, no database lookup, for hot endpoints that just need
+    an owner for rate limits and chat history (a deactivated user's token keeps
+    working here until it expires).
+    """
+    if credentials is None:
+        return None
+    return verify_token(credentials.credentials)
+
 # Optional: Create admin user dependency
 async def get_admin_user(current_user: dict = Depends(get_current_user)):
     """Get current user if they are admin"""
@@ -0,0 +1,184 @@
+# Offline index builder - builds a portable index snapshot from a directory of PDFs
+#
+# Usage:
+#   python build_index.py assets/ --output ./shared_index --workers 4
+#
+# PDFs are extracted and chunked in parallel worker processes while the main
+# process embeds finished documents. Every embedded PDF is checkpointed under
+# <output>/.build/, so re-running the same command after an interruption only
+# processes the remaining files. The result is a self-describing snapshot
+# (vectors, records, lexical statistics, manifest) in the shared index format:
+# copy the output directory to any API node and start it with
+#   RAG_SHARED_INDEX_DIR=<output>
+# The node maps the snapshot atomically through its CURRENT file, so no
+# re-embedding happens on serving nodes.
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import numpy as np
+
+import ingestion
+from shared_index import SharedVectorIndex, EMBEDDING_MODEL_NAME, file_sha256, get_embedding_model
+
+CHECKPOINT_DIR = ".build"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build a portable RAG index snapshot from PDFs")
+    parser.add_argument("pdf_dir", help="Directory containing the PDF files")
+    parser.add_argument("--output", default="./shared_index", help="Snapshot directory (default: ./shared_index)")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() - 1),
+                        help="Parallel extraction/chunking processes")
+    parser.add_argument("--chunk-size", type=int, default=ingestion.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=ingestion.DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=64, help="Embedding batch size")
+    parser.add_argument("--dedup-threshold", type=float,
+                        default=ingestion.DEDUP_THRESHOLD if ingestion.DEDUP_ENABLED else 0,
+                        help="Collapse chunks at least this similar (MinHash Jaccard); 0 disables")
+    parser.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--keep-checkpoint", action="store_true", help="Keep the checkpoint after publishing")
+    return parser.parse_args(argv)
+
+def _chunk_worker(pdf_path: str, chunk_size: int, chunk_overlap: int) -> List[Dict]:
+    """Runs in a worker process: extract and chunk one PDF"""
+    return [
+        {"page_content": doc.page_content, "metadata": doc.metadata}
+        for doc in ingestion.chunk_pdf(pdf_path, chunk_size, chunk_overlap)
+    ]
+
+def _write_json_atomic(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class Checkpoint:
+    """Per-PDF shards of embedded chunks plus a state file listing finished PDFs"""
+
+    def __init__(self, root: str, config: Dict, fresh: bool):
+        self.root = root
+        self.state_path = os.path.join(root, "state.json")
+        if fresh:
+            shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root, exist_ok=True)
+
+        self.state = {"config": config, "done": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if state.get("config") != config:
+                raise SystemExit(
+                    f"Checkpoint in {root} was made with different settings; rerun with --fresh"
+                )
+            self.state = state
+
+    def is_done(self, sha256: str) -> bool:
+        return sha256 in self.state["done"]
+
+    def save_shard(self, sha256: str, source: str, vectors: np.ndarray, records: List[Dict]):
+        np.save(os.path.join(self.root, f"{sha256}.npy"), vectors)
+        _write_json_atomic(os.path.join(self.root, f"{sha256}.json"), records)
+        self.state["done"][sha256] = source
+        _write_json_atomic(self.state_path, self.state)
+
+    def load_shard(self, sha256: str):
+        vectors = np.load(os.path.join(self.root, f"{sha256}.npy"))
+        with open(os.path.join(self.root, f"{sha256}.json")) as f:
+            records = json.load(f)
+        return vectors, records
+
+def build(args) -> str:
+    pdf_paths = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))
+    if not pdf_paths:
+        raise SystemExit(f"No PDFs found in {args.pdf_dir}")
+
+    config = {
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "embedding_model": EMBEDDING_MODEL_NAME
+    }
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(args.output, CHECKPOINT_DIR), config, args.fresh)
+
+    hashes = {path: file_sha256(path) for path in pdf_paths}
+    todo = [path for path in pdf_paths if not checkpoint.is_done(hashes[path])]
+    print(f"{len(pdf_paths)} PDFs, {len(pdf_paths) - len(todo)} already in checkpoint, {len(todo)} to process")
+
+    started = time.perf_counter()
+    if todo:
+        embedding_model = get_embedding_model()
+        # spawn: workers must not inherit the torch state loaded above
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+            futures = {
+                pool.submit(_chunk_worker, path, args.chunk_size, args.chunk_overlap): path
+                for path in todo
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                records = future.result()
+                texts = [record["page_content"] for record in records]
+                vectors = np.asarray(
+                    [vector for start in range(0, len(texts), args.batch_size)
+                     for vector in embedding_model.embed_documents(texts[start:start + args.batch_size])],
+                    dtype=np.float32
+                )
+                checkpoint.save_shard(hashes[path], os.path.basename(path), vectors, records)
+                print(f"  {os.path.basename(path)}: {len(records)} chunks")
+
+    # Assemble shards in a deterministic order
+    all_vectors, all_records, sources = [], [], []
+    for path in pdf_paths:
+        vectors, records = checkpoint.load_shard(hashes[path])
+        if records:
+            all_vectors.append(vectors)
+            all_records.extend(records)
+        sources.append({"file": os.path.basename(path), "sha256": hashes[path], "chunks": len(records)})
+
+    if not all_records:
+        raise SystemExit("No text could be extracted from the PDFs")
+
+    all_vectors = np.concatenate(all_vectors)
+    if args.dedup_threshold > 0:
+        # Across PDFs, after checkpointing: per-PDF shards stay valid when other PDFs change
+        groups = ingestion.find_near_duplicates([record["page_content"] for record in all_records],
+                                                args.dedup_threshold)
+        canonical_rows = [group[0] for group in groups]
+        deduplicated = [
+            {**all_records[group[0]],
+             "metadata": ingestion.merge_duplicate_metadata([all_records[row]["metadata"] for row in group])}
+            for group in groups
+        ]
+        print(f"Collapsed {len(all_records) - len(deduplicated)} near-duplicate chunks")
+        all_records, all_vectors = deduplicated, all_vectors[canonical_rows]
+
+    lexical = ingestion.lexical_stats([record["page_content"] for record in all_records])
+    index = SharedVectorIndex(args.output)
+    generation = index.publish(
+        all_vectors,
+        all_records,
+        extra_manifest={
+            "builder": {**config, "tool": "build_index.py", "dedup_threshold": args.dedup_threshold,
+                        "build_seconds": round(time.perf_counter() - started, 1)},
+            "sources": sources
+        },
+        extra_files={"lexical.json": json.dumps(lexical).encode("utf-8")}
+    )
+
+    if not args.keep_checkpoint:
+        shutil.rmtree(checkpoint.root, ignore_errors=True)
+
+    print(f"Published {generation} with {len(all_records)} chunks to {args.output}")
+    return generation
+
+if __name__ == "__main__":
+    build(parse_args(sys.argv[1:]))
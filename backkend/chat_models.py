@@ -0,0 +1,28 @@
+# Chat History Models
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from models import SourceDocument
+
+class ChatSessionResponse(BaseModel):
+    session_id: str
+    title: str
+    message_count: int
+    created_at: datetime
+    updated_at: datetime
+
+class ChatSessionListResponse(BaseModel):
+    sessions: List[ChatSessionResponse]
+    next_cursor: Optional[str] = None
+
+class ChatMessageResponse(BaseModel):
+    id: str
+    question: str
+    answer: str
+    sources: List[SourceDocument]
+    created_at: datetime
+
+class ChatMessageListResponse(BaseModel):
+    session_id: str
+    messages: List[ChatMessageResponse]
+    next_cursor: Optional[str] = None
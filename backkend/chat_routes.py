@@ -0,0 +1,111 @@
+# Chat History Routes
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from typing import Optional
+from chat_models import (
+    ChatSessionResponse, ChatSessionListResponse,
+    ChatMessageResponse, ChatMessageListResponse
+)
+from models import SourceDocument
+from user_models import MessageResponse
+from auth import get_current_active_user
+from database import chat_db, DB_UNAVAILABLE_ERRORS
+from http_responses import conditional_json
+
+router = APIRouter(prefix="/api/chat", tags=["Chat History"])
+
+@router.get("/sessions", response_model=ChatSessionListResponse)
+async def list_sessions(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    List the current user's chat sessions, most recently active first
+    (send the ETag back in If-None-Match to get 304 when nothing changed)
+    """
+    try:
+        sessions, next_cursor = await chat_db.get_sessions_page(
+            current_user["_id"], cursor=cursor, limit=limit
+        )
+        return conditional_json(request, ChatSessionListResponse(
+            sessions=[
+                ChatSessionResponse(
+                    session_id=session["session_id"],
+                    title=session.get("title", ""),
+                    message_count=session.get("message_count", 0),
+                    created_at=session["created_at"],
+                    updated_at=session["updated_at"]
+                )
+                for session in sessions
+            ],
+            next_cursor=next_cursor
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except DB_UNAVAILABLE_ERRORS:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch chat sessions"
+        )
+
+@router.get("/sessions/{session_id}/messages", response_model=ChatMessageListResponse)
+async def list_messages(
+    request: Request,
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Get messages of a session: the newest page first, each page in chronological order.
+    Pass next_cursor back as `cursor` to load older messages. Supports If-None-Match.
+    """
+    try:
+        messages, next_cursor = await chat_db.get_messages_page(
+            current_user["_id"], session_id, cursor=cursor, limit=limit
+        )
+        return conditional_json(request, ChatMessageListResponse(
+            session_id=session_id,
+            messages=[
+                ChatMessageResponse(
+                    id=message["_id"],
+                    question=message["question"],
+                    answer=message["answer"],
+                    sources=[SourceDocument(**src) for src in message.get("sources", [])],
+                    created_at=message["created_at"]
+                )
+                for message in messages
+            ],
+            next_cursor=next_cursor
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except DB_UNAVAILABLE_ERRORS:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch chat messages"
+        )
+
+@router.delete("/sessions/{session_id}", response_model=MessageResponse)
+async def delete_session(session_id: str, current_user: dict = Depends(get_current_active_user)):
+    """
+    Delete a chat session and its messages
+    """
+    try:
+        deleted = await chat_db.delete_session(current_user["_id"], session_id)
+    except DB_UNAVAILABLE_ERRORS:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete chat session"
+        )
+    
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
+    return MessageResponse(message="Chat session deleted")
@@ -0,0 +1,110 @@
+# Single-flight request coalescing for identical in-flight questions
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+class SingleFlight:
+    """Runs one computation per key; concurrent callers with the same key share its result.
+
+    The shared work runs in its own task, so a caller that disconnects does
+    not cancel the computation for everyone else waiting on it.
+    """
+
+    def __init__(self):
+        self.flights: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self.flights.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self.flights[key] = task
+            task.add_done_callback(lambda _: self.flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self.flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+class StreamFlight:
+    """Events of one streaming generation, replayable by late subscribers"""
+
+    def __init__(self):
+        self.events: list = []
+        self.done = False
+        # The producer task: the event loop only keeps weak references to tasks
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Tuple[str, Any]):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self):
+        """Yield every event from the start of the stream until it finishes"""
+        position = 0
+        while True:
+            if position < len(self.events):
+                yield self.events[position]
+                position += 1
+            elif self.done:
+                return
+            else:
+                await self._changed.wait()
+
+class SingleFlightStream:
+    """Coalesces identical streaming requests onto one shared token stream"""
+
+    def __init__(self):
+        self.flights: Dict[str, StreamFlight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key: str, start: Callable[[StreamFlight], Awaitable[None]]) -> StreamFlight:
+        """Attach to the stream for `key`, starting `start(flight)` if none is running"""
+        flight = self.flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return flight
+
+        self.leaders += 1
+        flight = StreamFlight()
+        self.flights[key] = flight
+
+        async def run():
+            try:
+                await start(flight)
+            except Exception as e:
+                flight.publish(("error", str(e)))
+            finally:
+                self.flights.pop(key, None)
+                flight.task = None
+                flight.finish()
+
+        flight.task = asyncio.ensure_future(run())
+        return flight
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self.flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+# Global coalescers for /ask and /ask/stream
+ask_flights = SingleFlight()
+ask_stream_flights = SingleFlightStream()
@@ -1,94 +1,396 @@
 # MongoDB Database Configuration and User Model
 import os
+import random
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, InvalidOperation
 from bson import ObjectId
-from datetime import datetime
-from typing import Optional, Dict, Any
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
 import asyncio
 
+class DatabaseUnavailableError(Exception):
+    """Raised when MongoDB is not reachable (mapped to 503 by the app)"""
+
+# Errors that mean "try again later" rather than a bug in the request
+# (InvalidOperation: a request still holding a collection of a client the health checker closed)
+DB_UNAVAILABLE_ERRORS = (DatabaseUnavailableError, ConnectionFailure, InvalidOperation)
+
+class IndexSetupError(Exception):
+    """Raised when a required index (the unique email index) could not be built"""
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool statistics for monitoring"""
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.open_connections = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        self.pool_clears += 1
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        self.open_connections += 1
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        self.open_connections = max(0, self.open_connections - 1)
+    
+    def connection_check_out_started(self, event):
+        pass
+    
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+        self._record_wait(getattr(event, "duration", None))
+    
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+        self.checkouts += 1
+        self._record_wait(getattr(event, "duration", None))
+    
+    def connection_checked_in(self, event):
+        self.checked_out = max(0, self.checked_out - 1)
+    
+    def _record_wait(self, duration: Optional[float]):
+        if duration is None:
+            return
+        self.wait_time_total += duration
+        self.wait_time_max = max(self.wait_time_max, duration)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "open_connections": self.open_connections,
+            "checked_out": self.checked_out,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "pool_clears": self.pool_clears,
+            "wait_time_avg_ms": round(self.wait_time_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "wait_time_max_ms": round(self.wait_time_max * 1000, 3)
+        }
+
 class MongoDB:
     client: AsyncIOMotorClient = None
     database = None
+    healthy: bool = False
+    consecutive_failures: int = 0
+    last_error: Optional[str] = None
+    last_check: Optional[datetime] = None
+    health_task: Optional[asyncio.Task] = None
+    indexes_ready: bool = False
 
 # Global database instance
 db = MongoDB()
+pool_stats = PoolStatsListener()
+
+# Connection pool / timeout settings (override through environment variables)
+DATABASE_NAME = os.getenv("MONGODB_DATABASE", "study_assistant")
+MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "5"))
+MAX_CONNECTING = int(os.getenv("MONGODB_MAX_CONNECTING", "4"))
+MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "20000"))
+COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zstd,snappy,zlib")
+
+# Health checker settings (seconds)
+HEALTH_CHECK_INTERVAL = float(os.getenv("MONGODB_HEALTH_CHECK_INTERVAL", "15"))
+RECONNECT_BACKOFF_MIN = float(os.getenv("MONGODB_RECONNECT_BACKOFF_MIN", "0.5"))
+RECONNECT_BACKOFF_MAX = float(os.getenv("MONGODB_RECONNECT_BACKOFF_MAX", "30"))
+
+# How long an estimated user count may be served from cache (seconds)
+USER_COUNT_CACHE_TTL = float(os.getenv("USER_COUNT_CACHE_TTL", "60"))
+
+# Indexes managed at startup, keyed by collection name
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("created_at", DESCENDING)], name="created_at_desc"),
+    ],
+    "chat_sessions": [
+        IndexModel([("user_id", ASCENDING), ("session_id", ASCENDING)], unique=True, name="user_session_unique"),
+        IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="user_updated_at"),
+    ],
+    "chat_messages": [
+        IndexModel(
+            [("user_id", ASCENDING), ("session_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_session_created_at"
+        ),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+}
+
+# Collections whose indexes enforce correctness: create_user/update_user rely on
+# email_unique to reject duplicate emails, so failing to build it is fatal
+REQUIRED_INDEX_COLLECTIONS = {"users"}
+
+# Chat history write batching
+CHAT_HISTORY_BATCH_SIZE = int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "100"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "1.0"))
+CHAT_HISTORY_MAX_QUEUE = int(os.getenv("CHAT_HISTORY_MAX_QUEUE", "10000"))
+
+# Projections used for user lookups (never return the hash unless asked for)
+USER_PUBLIC_PROJECTION = {"hashed_password": 0}
+USER_AUTH_PROJECTION = {
+    "email": 1,
+    "hashed_password": 1,
+    "full_name": 1,
+    "is_active": 1,
+    "created_at": 1,
+    "last_login": 1
+}
+USER_LIST_PROJECTION = {
+    "email": 1,
+    "full_name": 1,
+    "is_active": 1,
+    "created_at": 1,
+    "last_login": 1
+}
+
+async def ensure_indexes(database):
+    """Create the indexes declared in INDEXES (no-op if they already exist)"""
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await database[collection_name].create_indexes(indexes)
+        except DB_UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            if collection_name in REQUIRED_INDEX_COLLECTIONS:
+                raise IndexSetupError(f"Failed to create indexes on {collection_name}: {e}") from e
+            print(f"Failed to create indexes on {collection_name}: {e}")
+
+def _available_compressors() -> list:
+    """Keep only the wire compressors whose Python packages are installed"""
+    modules = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+    available = []
+    for name in [c.strip() for c in COMPRESSORS.split(",") if c.strip()]:
+        try:
+            __import__(modules.get(name, name))
+            available.append(name)
+        except ImportError:
+            continue
+    return available
+
+def _create_client(mongo_url: str) -> AsyncIOMotorClient:
+    """Create a Motor client with tuned pool settings"""
+    options = {
+        "maxPoolSize": MAX_POOL_SIZE,
+        "minPoolSize": MIN_POOL_SIZE,
+        "maxConnecting": MAX_CONNECTING,
+        "maxIdleTimeMS": MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": SOCKET_TIMEOUT_MS,
+        "retryWrites": True,
+        "retryReads": True,
+        "event_listeners": [pool_stats]
+    }
+    compressors = _available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return AsyncIOMotorClient(mongo_url, **options)
+
+async def _try_connect(mongo_url: str) -> bool:
+    """Ping MongoDB, (re)creating the client if needed. Returns True on success."""
+    try:
+        if db.client is None:
+            db.client = _create_client(mongo_url)
+        
+        await db.client.admin.command('ping')
+        
+        first_connect = db.database is None
+        db.database = db.client[DATABASE_NAME]
+        db.healthy = True
+        db.consecutive_failures = 0
+        db.last_error = None
+        db.last_check = datetime.utcnow()
+        
+        if first_connect:
+            print("Successfully connected to MongoDB")
+        if not db.indexes_ready:
+            await ensure_indexes(db.database)
+            db.indexes_ready = True
+        return True
+    except IndexSetupError:
+        raise
+    except Exception as e:
+        db.healthy = False
+        db.consecutive_failures += 1
+        db.last_error = str(e)
+        db.last_check = datetime.utcnow()
+        return False
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    # Cap the exponent: 2.0 ** attempt overflows after about 1000 failed attempts
+    ceiling = min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_MIN * (2 ** min(attempt, 16)))
+    return random.uniform(RECONNECT_BACKOFF_MIN, max(RECONNECT_BACKOFF_MIN, ceiling))
+
+async def _health_check_loop(mongo_url: str):
+    """Ping MongoDB periodically and reconnect with backoff while it is down"""
+    while True:
+        if db.healthy:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+        else:
+            await asyncio.sleep(_backoff_delay(db.consecutive_failures))
+        
+        was_healthy = db.healthy
+        try:
+            ok = await _try_connect(mongo_url)
+        except IndexSetupError as e:
+            # Reachable, but duplicate emails would not be rejected: signups stay refused
+            print(f"{e} (signups are refused until it exists)")
+            ok = True
+        
+        if ok and not was_healthy:
+            print("MongoDB connection restored")
+        elif not ok and was_healthy:
+            print(f"MongoDB health check failed: {db.last_error}")
+        
+        # A client that keeps failing (e.g. stale DNS/SRV records) is rebuilt
+        if not ok and db.consecutive_failures % 5 == 0 and db.client is not None:
+            db.client.close()
+            db.client = None
+            # Requests get DatabaseUnavailableError (503) until a new client connects
+            db.database = None
 
 async def connect_to_mongo():
-    """Create database connection"""
+    """Create database connection and start the background health checker"""
     mongo_url = os.getenv("MONGODB_URL", "")
     
     if not mongo_url:
         print("Warning: MONGODB_URL not set in environment variables")
         return None
     
-    try:
-        db.client = AsyncIOMotorClient(mongo_url)
-        db.database = db.client.study_assistant
-        
-        # Test connection
-        await db.client.admin.command('ping')
-        print("Successfully connected to MongoDB")
-        return db.database
-    except Exception as e:
-        print(f"Failed to connect to MongoDB: {e}")
-        return None
+    # IndexSetupError (e.g. existing duplicate emails) propagates and fails startup
+    if not await _try_connect(mongo_url):
+        print(f"Failed to connect to MongoDB: {db.last_error} (retrying in background)")
+    
+    if db.health_task is None:
+        db.health_task = asyncio.create_task(_health_check_loop(mongo_url))
+    
+    return db.database
 
 async def close_mongo_connection():
-    """Close database connection"""
+    """Stop the health checker and close database connection"""
+    if db.health_task:
+        db.health_task.cancel()
+        try:
+            await db.health_task
+        except asyncio.CancelledError:
+            pass
+        db.health_task = None
+    
     if db.client:
         db.client.close()
+        db.client = None
+    db.database = None
+    db.healthy = False
+    db.indexes_ready = False
+
+def get_database_health() -> Dict[str, Any]:
+    """Connection health and pool statistics for monitoring"""
+    return {
+        "connected": db.database is not None,
+        "healthy": db.healthy,
+        "consecutive_failures": db.consecutive_failures,
+        "indexes_ready": db.indexes_ready,
+        "last_error": db.last_error,
+        "last_check": db.last_check.isoformat() if db.last_check else None,
+        "pool": {
+            "max_pool_size": MAX_POOL_SIZE,
+            "min_pool_size": MIN_POOL_SIZE,
+            **pool_stats.snapshot()
+        }
+    }
 
 class UserDatabase:
     def __init__(self):
         self.collection_name = "users"
+        self._count_cache: Optional[Tuple[int, float]] = None
     
     def get_collection(self):
         """Get users collection"""
         if db.database is None:
-            raise Exception("Database not connected. Please check MONGODB_URL")
+            raise DatabaseUnavailableError("Database not connected. Please check MONGODB_URL")
         return db.database[self.collection_name]
     
-    async def create_user(self, email: str, hashed_password: str, full_name: str = None) -> str:
-        """Create a new user and return user ID"""
+    @staticmethod
+    def _require_email_index():
+        """Duplicate emails are only rejected by email_unique, so refuse writes without it"""
+        if not db.indexes_ready:
+            raise DatabaseUnavailableError("Unique email index is not in place yet, please retry later")
+    
+    async def create_user(self, email: str, hashed_password: str, full_name: str = None) -> Dict[str, Any]:
+        """Create a new user and return the stored document (without password hash)"""
         collection = self.get_collection()
+        self._require_email_index()
         
-        # Check if user already exists
-        existing_user = await collection.find_one({"email": email})
-        if existing_user:
-            raise ValueError("Email already exists")
-        
+        now = datetime.utcnow()
         user_doc = {
             "email": email,
             "hashed_password": hashed_password,
             "full_name": full_name,
             "is_active": True,
-            "created_at": datetime.utcnow(),
-            "last_login": None
+            "created_at": now,
+            "last_login": now
         }
         
-        result = await collection.insert_one(user_doc)
-        return str(result.inserted_id)
+        # The unique email index rejects duplicates atomically
+        try:
+            result = await collection.insert_one(user_doc)
+        except DuplicateKeyError:
+            raise ValueError("Email already exists")
+        
+        user_doc["_id"] = str(result.inserted_id)
+        user_doc.pop("hashed_password", None)
+        return user_doc
     
-    async def get_user_by_email(self, email: str) -> Optional[Dict[Any, Any]]:
+    async def get_user_by_email(self, email: str, include_password: bool = False) -> Optional[Dict[Any, Any]]:
         """Get user by email"""
         collection = self.get_collection()
-        user = await collection.find_one({"email": email})
+        projection = USER_AUTH_PROJECTION if include_password else USER_PUBLIC_PROJECTION
+        user = await collection.find_one({"email": email}, projection)
         
         if user:
             user["_id"] = str(user["_id"])  # Convert ObjectId to string
             return user
         return None
     
-    async def get_user_by_id(self, user_id: str) -> Optional[Dict[Any, Any]]:
+    async def get_user_by_id(self, user_id: str, include_password: bool = False) -> Optional[Dict[Any, Any]]:
         """Get user by ID"""
         collection = self.get_collection()
+        projection = USER_AUTH_PROJECTION if include_password else USER_PUBLIC_PROJECTION
         
         try:
-            user = await collection.find_one({"_id": ObjectId(user_id)})
+            user = await collection.find_one({"_id": ObjectId(user_id)}, projection)
             if user:
                 user["_id"] = str(user["_id"])  # Convert ObjectId to string
                 return user
-        except Exception as e:
+        except InvalidId as e:
             print(f"Error getting user by ID: {e}")
         
         return None
@@ -117,42 +419,329 @@ class UserDatabase:
         except Exception as e:
             print(f"Error deactivating user: {e}")
     
-    async def update_user(self, user_id: str, update_data: Dict[str, Any]):
-        """Update user data"""
+    async def update_user(self, user_id: str, update_data: Dict[str, Any]) -> Optional[Dict[Any, Any]]:
+        """Update user data and return the updated document (None on failure)"""
         collection = self.get_collection()
+        if "email" in update_data:
+            self._require_email_index()
         
         try:
             # Add updated_at timestamp
             update_data["updated_at"] = datetime.utcnow()
             
-            result = await collection.update_one(
+            user = await collection.find_one_and_update(
                 {"_id": ObjectId(user_id)},
-                {"$set": update_data}
+                {"$set": update_data},
+                projection=USER_PUBLIC_PROJECTION,
+                return_document=ReturnDocument.AFTER
             )
-            return result.modified_count > 0
+            if user:
+                user["_id"] = str(user["_id"])
+            return user
+        except DuplicateKeyError:
+            raise ValueError("Email already exists")
+        except DB_UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             print(f"Error updating user: {e}")
-            return False
+            return None
     
-    async def get_all_users(self, skip: int = 0, limit: int = 100) -> list:
-        """Get all users with pagination"""
+    async def get_users_page(self, after: Optional[str] = None, limit: int = 100) -> Tuple[list, Optional[str]]:
+        """Get one page of users ordered by _id (keyset pagination).
+        
+        Returns the users and the cursor for the next page (None on the last page).
+        """
         collection = self.get_collection()
         
-        cursor = collection.find({}).skip(skip).limit(limit)
+        query = {}
+        if after:
+            try:
+                query["_id"] = {"$gt": ObjectId(after)}
+            except InvalidId:
+                raise ValueError("Invalid cursor")
+        
+        # Fetch one extra document to know whether another page exists
+        cursor = collection.find(query, USER_LIST_PROJECTION).sort("_id", ASCENDING).limit(limit + 1)
         users = []
         
         async for user in cursor:
             user["_id"] = str(user["_id"])
-            # Remove sensitive data
-            user.pop("hashed_password", None)
             users.append(user)
         
-        return users
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = users[-1]["_id"]
+        
+        return users, next_cursor
     
-    async def count_users(self) -> int:
-        """Count total number of users"""
+    async def iter_users(self, batch_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every user straight from the cursor, without buffering the collection"""
         collection = self.get_collection()
-        return await collection.count_documents({})
+        
+        cursor = collection.find({}, USER_LIST_PROJECTION).sort("_id", ASCENDING).batch_size(batch_size)
+        async for user in cursor:
+            user["_id"] = str(user["_id"])
+            yield user
+    
+    async def count_users(self, estimated: bool = False) -> int:
+        """Count total number of users.
+        
+        With estimated=True the count comes from collection metadata and is
+        cached for USER_COUNT_CACHE_TTL seconds instead of scanning the index.
+        """
+        collection = self.get_collection()
+        
+        if not estimated:
+            return await collection.count_documents({})
+        
+        now = time.monotonic()
+        if self._count_cache is not None and now - self._count_cache[1] < USER_COUNT_CACHE_TTL:
+            return self._count_cache[0]
+        
+        count = await collection.estimated_document_count()
+        self._count_cache = (count, now)
+        return count
 
 # Global user database instance
 user_db = UserDatabase()
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _encode_cursor(timestamp: datetime, object_id: ObjectId) -> str:
+    """Encode a (timestamp, _id) keyset position; MongoDB stores milliseconds"""
+    millis = (timestamp.replace(tzinfo=None) - _EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}_{object_id}"
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        millis, object_id = cursor.split("_", 1)
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(object_id)
+    except (ValueError, InvalidId):
+        raise ValueError("Invalid cursor")
+
+class ChatDatabase:
+    """Chat sessions and their question/answer messages, scoped per user"""
+    
+    def __init__(self):
+        self.sessions_collection_name = "chat_sessions"
+        self.messages_collection_name = "chat_messages"
+    
+    def get_sessions_collection(self):
+        """Get chat sessions collection"""
+        if db.database is None:
+            raise DatabaseUnavailableError("Database not connected. Please check MONGODB_URL")
+        return db.database[self.sessions_collection_name]
+    
+    def get_messages_collection(self):
+        """Get chat messages collection"""
+        if db.database is None:
+            raise DatabaseUnavailableError("Database not connected. Please check MONGODB_URL")
+        return db.database[self.messages_collection_name]
+    
+    async def save_messages(self, messages: List[Dict[str, Any]]):
+        """Insert a batch of messages and upsert their sessions (two round-trips per batch)"""
+        if not messages:
+            return
+        
+        await self.get_messages_collection().insert_many(messages, ordered=False)
+        
+        # Collapse the batch into one upsert per session
+        session_updates = {}
+        for message in messages:
+            key = (message["user_id"], message["session_id"])
+            update = session_updates.setdefault(key, {
+                "title": message["question"][:80],
+                "created_at": message["created_at"],
+                "updated_at": message["created_at"],
+                "count": 0
+            })
+            update["updated_at"] = max(update["updated_at"], message["created_at"])
+            update["count"] += 1
+        
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "session_id": session_id},
+                {
+                    "$setOnInsert": {"title": update["title"], "created_at": update["created_at"]},
+                    "$max": {"updated_at": update["updated_at"]},
+                    "$inc": {"message_count": update["count"]}
+                },
+                upsert=True
+            )
+            for (user_id, session_id), update in session_updates.items()
+        ]
+        await self.get_sessions_collection().bulk_write(operations, ordered=False)
+    
+    async def get_sessions_page(self, user_id: str, cursor: Optional[str] = None, limit: int = 20) -> Tuple[list, Optional[str]]:
+        """Get a user's sessions, most recently active first (keyset pagination)"""
+        collection = self.get_sessions_collection()
+        
+        query = {"user_id": user_id}
+        if cursor:
+            updated_at, object_id = _decode_cursor(cursor)
+            query["$or"] = [
+                {"updated_at": {"$lt": updated_at}},
+                {"updated_at": updated_at, "_id": {"$lt": object_id}}
+            ]
+        
+        results = collection.find(query).sort([("updated_at", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1)
+        sessions = [session async for session in results]
+        
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            next_cursor = _encode_cursor(sessions[-1]["updated_at"], sessions[-1]["_id"])
+        
+        for session in sessions:
+            session["_id"] = str(session["_id"])
+        return sessions, next_cursor
+    
+    async def get_messages_page(self, user_id: str, session_id: str, cursor: Optional[str] = None, limit: int = 50) -> Tuple[list, Optional[str]]:
+        """Get messages of a session, newest page first.
+        
+        Each page is returned in chronological order; next_cursor points to older messages.
+        """
+        collection = self.get_messages_collection()
+        
+        query = {"user_id": user_id, "session_id": session_id}
+        if cursor:
+            created_at, object_id = _decode_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": object_id}}
+            ]
+        
+        results = collection.find(query).sort([("created_at", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1)
+        messages = [message async for message in results]
+        
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            next_cursor = _encode_cursor(messages[-1]["created_at"], messages[-1]["_id"])
+        
+        messages.reverse()
+        for message in messages:
+            message["_id"] = str(message["_id"])
+        return messages, next_cursor
+    
+    async def delete_session(self, user_id: str, session_id: str) -> bool:
+        """Delete a session and all of its messages"""
+        result = await self.get_sessions_collection().delete_one({"user_id": user_id, "session_id": session_id})
+        await self.get_messages_collection().delete_many({"user_id": user_id, "session_id": session_id})
+        return result.deleted_count > 0
+
+# Global chat database instance
+chat_db = ChatDatabase()
+
+class ChatHistoryWriter:
+    """Buffers chat messages in memory and writes them to MongoDB in batches.
+    
+    enqueue() never waits on the database, so saving history stays off the
+    request path; a background task flushes every CHAT_HISTORY_FLUSH_INTERVAL
+    seconds or as soon as CHAT_HISTORY_BATCH_SIZE messages are waiting.
+    """
+    
+    def __init__(self, chat_database: ChatDatabase, batch_size: int = CHAT_HISTORY_BATCH_SIZE,
+                 flush_interval: float = CHAT_HISTORY_FLUSH_INTERVAL, max_queue: int = CHAT_HISTORY_MAX_QUEUE):
+        self.chat_database = chat_database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._inflight: Optional[asyncio.Future] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+    
+    def enqueue(self, user_id: str, session_id: str, question: str, answer: str, sources: list) -> bool:
+        """Queue a question/answer pair for saving. Returns False if it was dropped."""
+        if self.queue is None:
+            self.dropped += 1
+            return False
+        
+        try:
+            self.queue.put_nowait({
+                "user_id": user_id,
+                "session_id": session_id,
+                "question": question,
+                "answer": answer,
+                "sources": sources,
+                "created_at": datetime.utcnow()
+            })
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+    
+    async def start(self):
+        """Start the background flush task"""
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the flush task, writing out anything still queued"""
+        if self.task is None:
+            return
+        
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        
+        # Let an interrupted write finish, then save what was collected or queued
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        remaining = self._batch
+        self._batch = []
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait())
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start:start + self.batch_size])
+        self.queue = None
+    
+    async def _run(self):
+        while True:
+            self._batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            batch, self._batch = self._batch, []
+            # Shielded so that stop() cannot cancel a write halfway
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+    
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        try:
+            await self.chat_database.save_messages(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed_batches += 1
+            self.dropped += len(batch)
+            print(f"Failed to save chat history batch of {len(batch)}: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize() if self.queue else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches
+        }
+
+# Global chat history writer (started and stopped with the app)
+chat_history_writer = ChatHistoryWriter(chat_db)
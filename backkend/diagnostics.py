@@ -0,0 +1,156 @@
+# Diagnostics - on-demand sampling profiler and memory breakdown for admin endpoints
+#
+# Nothing here runs unless an admin asks for it: the profiler thread exists
+# only for the duration of a request, and with DIAGNOSTICS_ENABLED=false the
+# admin router is not even mounted (see main.py).
+import os
+import gc
+import sys
+import importlib
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS_ENABLED", "false").lower() == "true"
+PROFILE_MAX_SECONDS = float(os.getenv("DIAGNOSTICS_PROFILE_MAX_SECONDS", "60"))
+
+# Stdlib functions ("module:qualname") a parked thread sits in as its innermost
+# Python frame (the blocking call below them is C); only these exact functions
+# count as idle, so e.g. Headers.get or a contended lock in our code still shows
+IDLE_FUNCTIONS = (
+    "threading:Condition.wait",
+    "threading:Event.wait",
+    "threading:Thread.join",
+    "threading:Thread._wait_for_tstate_lock",
+    "queue:Queue.get",
+    "selectors:SelectSelector.select",
+    "selectors:PollSelector.select",
+    "selectors:EpollSelector.select",
+    "selectors:DevpollSelector.select",
+    "selectors:KqueueSelector.select",
+    "socket:socket.accept",
+    "concurrent.futures.thread:_worker",
+)
+
+def _idle_code_objects() -> frozenset:
+    """Code objects of IDLE_FUNCTIONS available on this platform and Python version"""
+    codes = set()
+    for name in IDLE_FUNCTIONS:
+        module_name, _, qualname = name.partition(":")
+        target = importlib.import_module(module_name)
+        for attribute in qualname.split("."):
+            target = getattr(target, attribute, None)
+        code = getattr(target, "__code__", None)
+        if code is not None:
+            codes.add(code)
+    return frozenset(codes)
+
+IDLE_CODE = _idle_code_objects()
+
+class ProfilerBusy(Exception):
+    """Another profile is already being collected"""
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """Samples the Python stack of every thread at a fixed interval.
+
+    Works from a separate thread with sys._current_frames(), so it sees the
+    event loop, executor threads (asyncio.to_thread, retrieval) and any other
+    worker threads without instrumenting them. Results are in the folded
+    stack format ("thread;outer;...;inner count") read by flamegraph.pl,
+    speedscope and most other flamegraph tools.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, seconds: float, interval: float, include_idle: bool = False) -> Tuple[Counter, int]:
+        """Block for `seconds` collecting stacks; returns (folded stack counts, samples taken)"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            own_thread = threading.get_ident()
+            stacks: Counter = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    if not include_idle and frame.f_code in IDLE_CODE:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, f"thread-{thread_id}"))
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+            return stacks, samples
+        finally:
+            self._lock.release()
+
+def format_folded(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+profiler = SamplingProfiler()
+
+def _process_memory() -> Dict[str, Optional[int]]:
+    """Resident and peak memory of this process in bytes"""
+    memory = {"rss_bytes": None, "peak_rss_bytes": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss_bytes"] = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_bytes"] = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        memory["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return memory
+
+def _tracemalloc_top(limit: int = 15):
+    """Largest allocation sites, only if tracing was enabled (PYTHONTRACEMALLOC=1)"""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    return [
+        {"location": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+def memory_report(rag_service=None) -> Dict[str, object]:
+    """Memory breakdown by component (RAG parts only if the service is loaded)"""
+    from rate_limit import rate_limit_backend, InMemoryRateLimitBackend
+    from coalesce import ask_flights, ask_stream_flights
+    from database import chat_history_writer
+
+    caches = {
+        "rate_limit_buckets": len(rate_limit_backend.buckets)
+        if isinstance(rate_limit_backend, InMemoryRateLimitBackend) else len(rate_limit_backend.fallback.buckets),
+        "coalescing_in_flight": len(ask_flights.flights) + len(ask_stream_flights.flights),
+        "chat_history_queue": chat_history_writer.stats()
+    }
+    return {
+        "process": _process_memory(),
+        "gc": {
+            "tracked_objects": len(gc.get_objects()),
+            "frozen_objects": gc.get_freeze_count(),
+            "generation_counts": gc.get_count()
+        },
+        "rag": rag_service.memory_usage() if rag_service is not None else None,
+        "caches": caches,
+        "tracemalloc_top": _tracemalloc_top()
+    }
@@ -0,0 +1,320 @@
+# Retrieval evaluation - quality vs. cost of chunking strategies, k and retrieval modes
+#
+# Usage:
+#   python evaluate_retrieval.py
+#   python evaluate_retrieval.py --strategies 800/100,400/50,page --k 3,5,10 --modes dense,hybrid
+#
+# Every strategy chunks the PDFs in assets/ from scratch and embeds them with
+# the serving embedding model, then answers the golden questions in
+# retrieval_golden.json with each retrieval mode:
+#   dense    cosine similarity over the sentence embeddings (what /ask uses)
+#   lexical  BM25 over the statistics from ingestion.lexical_stats
+#   hybrid   reciprocal rank fusion of the dense and lexical rankings
+#   dense-int8  dense search over int8 codes with float32 re-scoring
+#               (RAG_INDEX_QUANTIZATION=int8); also reports how much of the
+#               exact dense top k it recovers
+#   hierarchical  dense search over the chunks of the RAG_HIERARCHY_FANOUT
+#                 lectures picked by section vectors (RAG_HIERARCHICAL=true);
+#                 also reports exact-top-k overlap
+# A retrieved chunk is relevant when it comes from the expected PDF and covers
+# one of the expected pages. The report lists recall@k (share of questions
+# with a relevant chunk in the top k) and MRR next to index size, ingestion
+# time and per-query latency. Pick RAG_CHUNK_SIZE, RAG_CHUNK_OVERLAP and
+# RAG_TOP_K from it.
+import os
+import sys
+import json
+import math
+import time
+import glob
+import argparse
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import ingestion
+from hierarchy import HIERARCHY_FANOUT, RoutingIndex
+from shared_index import EMBEDDING_MODEL_NAME, get_embedding_model, quantize_int8, quantized_search
+
+MODES = ("dense", "lexical", "hybrid", "dense-int8", "hierarchical")
+DEFAULT_STRATEGIES = "400/50,800/100,1200/150,page"
+# BM25 parameters and the reciprocal rank fusion constant
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+# Depth of each ranking fed into the hybrid fusion
+FUSION_DEPTH = 50
+
+def parse_args(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and cost for chunking/k settings")
+    parser.add_argument("--pdf-dir", default=os.path.join(here, "assets"), help="Directory containing the PDFs")
+    parser.add_argument("--golden", default=os.path.join(here, "retrieval_golden.json"), help="Golden question set")
+    parser.add_argument("--strategies", default=DEFAULT_STRATEGIES,
+                        help="Comma separated chunk_size/overlap pairs, or 'page' for one chunk per PDF page")
+    parser.add_argument("--k", default="1,3,5,10", help="Comma separated k values for recall@k")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated retrieval modes")
+    parser.add_argument("--batch-size", type=int, default=64, help="Embedding batch size")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Collapse near-duplicate chunks like ingestion does (RAG_DEDUP_THRESHOLD)")
+    parser.add_argument("--output", help="Also write the full report as JSON to this file")
+    return parser.parse_args(argv)
+
+def _page_chunks(pdf_path: str) -> List[Dict]:
+    """One chunk per PDF page"""
+    return [
+        {"text": text, "page": page_number, "page_end": page_number}
+        for page_number, text in ingestion.extract_pages(pdf_path)
+    ]
+
+def chunk_corpus(pdf_paths: List[str], strategy: str, dedup: bool = False) -> List[Dict]:
+    """Chunk every PDF with one strategy into {text, source, page, page_end, locations} dicts"""
+    chunks = []
+    for path in pdf_paths:
+        source = os.path.basename(path)
+        if strategy == "page":
+            for chunk in _page_chunks(path):
+                chunks.append({**chunk, "source": source})
+            continue
+        chunk_size, chunk_overlap = (int(value) for value in strategy.split("/"))
+        for doc in ingestion.chunk_pdf(path, chunk_size, chunk_overlap):
+            chunks.append({
+                "text": doc.page_content,
+                "source": source,
+                "page": doc.metadata.get("page", 1),
+                "page_end": doc.metadata.get("page_end", doc.metadata.get("page", 1))
+            })
+    for chunk in chunks:
+        chunk["locations"] = [{"source": chunk["source"], "page": chunk["page"], "page_end": chunk["page_end"]}]
+    if not dedup:
+        return chunks
+
+    deduplicated = []
+    for group in ingestion.find_near_duplicates([chunk["text"] for chunk in chunks]):
+        canonical = dict(chunks[group[0]])
+        canonical["locations"] = [location for row in group for location in chunks[row]["locations"]]
+        deduplicated.append(canonical)
+    return deduplicated
+
+class BM25Index:
+    """Okapi BM25 over an inverted index built from ingestion.lexical_stats"""
+
+    def __init__(self, texts: List[str]):
+        self.stats = ingestion.lexical_stats(texts)
+        self.lengths = np.asarray(self.stats["lengths"], dtype=np.float32)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for row, text in enumerate(texts):
+            for token, tf in Counter(ingestion.tokenize(text)).items():
+                rows, tfs = postings.setdefault(token, ([], []))
+                rows.append(row)
+                tfs.append(tf)
+        for token, (rows, tfs) in postings.items():
+            self.postings[token] = (np.asarray(rows), np.asarray(tfs, dtype=np.float32))
+
+    def size_bytes(self) -> int:
+        return sum(rows.nbytes + tfs.nbytes for rows, tfs in self.postings.values()) + self.lengths.nbytes
+
+    def scores(self, query: str) -> np.ndarray:
+        total = self.stats["documents"]
+        avg_length = self.stats["avg_length"] or 1.0
+        scores = np.zeros(total, dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / avg_length)
+        for token in set(ingestion.tokenize(query)):
+            if token not in self.postings:
+                continue
+            df = self.stats["document_frequency"][token]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            rows, tfs = self.postings[token]
+            scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[rows])
+        return scores
+
+def _top(scores: np.ndarray, k: int) -> List[int]:
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return [int(row) for row in top[np.argsort(-scores[top])]]
+
+def _fuse(rankings: List[List[int]], k: int) -> List[int]:
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)[:k]
+
+def retrieve(mode: str, question: str, k: int, embedding_model, vectors: np.ndarray, bm25: BM25Index,
+             codes: np.ndarray, scales: np.ndarray, routing: RoutingIndex = None,
+             document_rows: List[np.ndarray] = None) -> List[int]:
+    """Rows of the top-k chunks for one question"""
+    if mode == "lexical":
+        return _top(bm25.scores(question), k)
+    query = np.asarray(embedding_model.embed_query(question), dtype=np.float32)
+    query /= np.linalg.norm(query) or 1.0
+    if mode == "dense-int8":
+        return [row for row, _ in quantized_search(codes, scales, vectors, query[None, :], k)[0]]
+    if mode == "hierarchical":
+        rows = np.concatenate([document_rows[document] for document in routing.select(query[None, :], HIERARCHY_FANOUT)[0]])
+        return [int(rows[row]) for row in _top(vectors[rows] @ query, k)]
+    dense = vectors @ query
+    if mode == "dense":
+        return _top(dense, k)
+    return _fuse([_top(dense, FUSION_DEPTH), _top(bm25.scores(question), FUSION_DEPTH)], k)
+
+def _is_relevant(chunk: Dict, item: Dict) -> bool:
+    # A collapsed chunk is relevant if any of its locations is
+    return any(
+        location["source"] == item["source"] and location["page"] <= page <= location["page_end"]
+        for location in chunk["locations"] for page in item["pages"]
+    )
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def evaluate_strategy(strategy: str, pdf_paths: List[str], golden: List[Dict], ks: List[int],
+                      modes: List[str], embedding_model, batch_size: int, dedup: bool = False) -> Dict:
+    started = time.perf_counter()
+    chunks = chunk_corpus(pdf_paths, strategy, dedup)
+    chunk_seconds = time.perf_counter() - started
+
+    texts = [chunk["text"] for chunk in chunks]
+    started = time.perf_counter()
+    vectors = np.asarray(
+        [vector for start in range(0, len(texts), batch_size)
+         for vector in embedding_model.embed_documents(texts[start:start + batch_size])],
+        dtype=np.float32
+    )
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    embed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    bm25 = BM25Index(texts)
+    lexical_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    codes, scales = quantize_int8(vectors)
+    quantize_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sources = [chunk["source"] for chunk in chunks]
+    routing = RoutingIndex.build(vectors, sources, range(len(chunks)))
+    document_rows = [np.flatnonzero(np.asarray(sources) == document) for document in routing.documents]
+    routing_seconds = time.perf_counter() - started
+
+    result = {
+        "strategy": strategy + ("+dedup" if dedup else ""),
+        "chunks": len(chunks),
+        "avg_chunk_chars": round(sum(len(text) for text in texts) / max(1, len(texts))),
+        "index_bytes": {
+            "vectors": int(vectors.nbytes),
+            "text": sum(len(text.encode("utf-8")) for text in texts),
+            "lexical": bm25.size_bytes(),
+            "int8_codes": int(codes.nbytes + scales.nbytes),
+            "routing": int(routing.section_vectors.nbytes)
+        },
+        "ingestion_seconds": {
+            "chunking": round(chunk_seconds, 2),
+            "embedding": round(embed_seconds, 2),
+            "lexical": round(lexical_seconds, 2),
+            "quantization": round(quantize_seconds, 2),
+            "routing": round(routing_seconds, 2)
+        },
+        "modes": {}
+    }
+
+    depth = max(ks)
+    for mode in modes:
+        hits = {k: 0 for k in ks}
+        reciprocal_ranks = []
+        latencies = []
+        agreement = []
+        for item in golden:
+            query_started = time.perf_counter()
+            rows = retrieve(mode, item["question"], depth, embedding_model, vectors, bm25, codes, scales,
+                            routing, document_rows)
+            latencies.append(time.perf_counter() - query_started)
+            if mode in ("dense-int8", "hierarchical"):
+                exact = retrieve("dense", item["question"], depth, embedding_model, vectors, bm25, codes, scales)
+                agreement.append(len(set(rows) & set(exact)) / len(exact))
+
+            first = next((rank for rank, row in enumerate(rows, 1) if _is_relevant(chunks[row], item)), None)
+            reciprocal_ranks.append(1.0 / first if first else 0.0)
+            for k in ks:
+                if first and first <= k:
+                    hits[k] += 1
+
+        result["modes"][mode] = {
+            "recall": {str(k): round(hits[k] / len(golden), 3) for k in ks},
+            f"mrr@{depth}": round(sum(reciprocal_ranks) / len(golden), 3),
+            "latency_ms": {
+                "p50": round(_percentile(latencies, 50) * 1000, 2),
+                "p95": round(_percentile(latencies, 95) * 1000, 2)
+            }
+        }
+        if agreement:
+            result["modes"][mode][f"exact_overlap@{depth}"] = round(sum(agreement) / len(agreement), 3)
+    return result
+
+# Index structures each mode keeps in memory (chunk text is needed by all of them)
+_MODE_INDEX_PARTS = {
+    "dense": ("vectors", "text"),
+    "lexical": ("lexical", "text"),
+    "hybrid": ("vectors", "lexical", "text"),
+    "dense-int8": ("int8_codes", "text"),
+    "hierarchical": ("vectors", "routing", "text")
+}
+
+def print_report(results: List[Dict], ks: List[int]):
+    depth = max(ks)
+    header = (f"{'strategy':<14} {'mode':<12} " + " ".join(f"{'R@' + str(k):>6}" for k in ks)
+              + f" {'MRR':>6} {'p50ms':>7} {'p95ms':>7} {'chunks':>7} {'index KB':>9} {'ingest s':>9}")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        ingest = sum(result["ingestion_seconds"].values())
+        for mode, scores in result["modes"].items():
+            index_kb = sum(result["index_bytes"][part] for part in _MODE_INDEX_PARTS[mode]) / 1024
+            print(f"{result['strategy']:<14} {mode:<12} "
+                  + " ".join(f"{scores['recall'][str(k)]:>6.3f}" for k in ks)
+                  + f" {scores[f'mrr@{depth}']:>6.3f} {scores['latency_ms']['p50']:>7.2f}"
+                  + f" {scores['latency_ms']['p95']:>7.2f} {result['chunks']:>7} {index_kb:>9.0f} {ingest:>9.1f}")
+
+def main(args) -> List[Dict]:
+    pdf_paths = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))
+    if not pdf_paths:
+        raise SystemExit(f"No PDFs found in {args.pdf_dir}")
+    with open(args.golden) as f:
+        golden = json.load(f)["questions"]
+
+    available = {os.path.basename(path) for path in pdf_paths}
+    missing = sorted({item["source"] for item in golden} - available)
+    if missing:
+        raise SystemExit(f"Golden set refers to PDFs not in {args.pdf_dir}: {', '.join(missing)}")
+
+    ks = sorted({int(k) for k in args.k.split(",")})
+    modes = [mode.strip() for mode in args.modes.split(",")]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        raise SystemExit(f"Unknown retrieval modes: {', '.join(unknown)}")
+
+    print(f"{len(golden)} golden questions over {len(pdf_paths)} PDFs, embedding model {EMBEDDING_MODEL_NAME}")
+    embedding_model = get_embedding_model()
+    embedding_model.embed_query("warm up")  # keep model start-up out of the timings
+
+    results = []
+    for strategy in [value.strip() for value in args.strategies.split(",")]:
+        print(f"Evaluating strategy {strategy}...")
+        results.append(evaluate_strategy(strategy, pdf_paths, golden, ks, modes, embedding_model,
+                                         args.batch_size, args.dedup))
+
+    print()
+    print_report(results, ks)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"embedding_model": EMBEDDING_MODEL_NAME, "questions": len(golden), "results": results}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return results
+
+if __name__ == "__main__":
+    main(parse_args(sys.argv[1:]))
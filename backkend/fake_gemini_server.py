@@ -0,0 +1,60 @@
+# Fake Gemini server for exercising llm_provider locally
+#
+# Usage:
+#   uvicorn fake_gemini_server:app --port 8090
+#   GEMINI_BASE_URL=http://localhost:8090/v1beta uvicorn main:app
+#
+# FAKE_LLM_LATENCY (seconds), FAKE_LLM_JITTER (seconds) and FAKE_LLM_ERROR_RATE (0-1)
+# shape the responses so timeouts, retries and hedging can be observed; failures
+# answer FAKE_LLM_ERROR_STATUS (503 overload by default, 429 for rate limiting).
+import os
+import json
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.3"))
+ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0.05"))
+ERROR_STATUS = int(os.getenv("FAKE_LLM_ERROR_STATUS", "503"))
+
+app = FastAPI(title="Fake Gemini API")
+
+def _answer_for(body: dict) -> str:
+    prompt = body["contents"][-1]["parts"][0]["text"]
+    return f"Fake answer ({len(prompt)} prompt characters). " * 5
+
+async def _delay_or_fail():
+    await asyncio.sleep(LATENCY + random.uniform(0, JITTER))
+    return random.random() < ERROR_RATE
+
+def _error() -> JSONResponse:
+    return JSONResponse(
+        status_code=ERROR_STATUS,
+        content={"error": {"message": "fake overload"}},
+        headers={"Retry-After": "7"}
+    )
+
+def _candidate(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request):
+    body = await request.json()
+    if await _delay_or_fail():
+        return _error()
+    return _candidate(_answer_for(body))
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, request: Request):
+    body = await request.json()
+    if await _delay_or_fail():
+        return _error()
+
+    async def events():
+        for word in _answer_for(body).split(" "):
+            await asyncio.sleep(0.01)
+            yield f"data: {json.dumps(_candidate(word + ' '))}\r\n\r\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,36 @@
+# Gunicorn configuration for multi-worker deployments
+#
+#   RAG_SHARED_INDEX_DIR=./shared_index gunicorn main:app -c gunicorn.conf.py
+#
+# The master loads the embedding model before forking so every worker shares
+# the weights copy-on-write, and workers read vectors from the memory-mapped
+# snapshots in RAG_SHARED_INDEX_DIR instead of each opening ./chroma_db.
+# Index writes (/init-db, /add-pdf) are serialised through the index writer
+# lock and picked up by the other workers on their next query.
+import gc
+import os
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app (and the model below) once in the master
+preload_app = True
+
+def on_starting(server):
+    if os.getenv("RAG_SHARED_INDEX_DIR") and os.getenv("RAG_PRELOAD_MODEL", "true").lower() == "true":
+        # Loading weights does not start torch's thread pools, so forking afterwards is safe;
+        # limit intra-op threads so N workers do not oversubscribe the CPUs
+        import torch
+        torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", "1")))
+
+        from shared_index import get_embedding_model
+        get_embedding_model()
+        server.log.info("Embedding model preloaded in master")
+
+    # Keep the garbage collector from touching (and un-sharing) preloaded objects
+    gc.freeze()
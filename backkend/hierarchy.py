@@ -0,0 +1,153 @@
+# Hierarchical retrieval - route a question to a few lectures before searching chunks
+#
+# Level 1 holds one vector per section (a run of consecutive chunks of one
+# document): the normalised mean of its chunk embeddings. A query scores the
+# sections, each document takes its best section score, and only the top
+# RAG_HIERARCHY_FANOUT documents are searched at chunk level. With the shared
+# index (rows stored contiguously per document) chunk search cost then grows
+# with the size of the selected documents, not the corpus; level 1 is
+# SECTION_CHUNKS times smaller than the chunk index. With Chroma the selection
+# is only a metadata filter on the one collection-wide HNSW index, so it
+# narrows the results but the search cost still follows the whole corpus.
+#
+# numpy is imported where it is used: service.py imports this module at
+# startup and the RAG stack's heavy imports are deferred (see service.py).
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+HIERARCHICAL_ENABLED = os.getenv("RAG_HIERARCHICAL", "false").lower() == "true"
+# Documents searched at chunk level per question
+HIERARCHY_FANOUT = int(os.getenv("RAG_HIERARCHY_FANOUT", "3"))
+# Consecutive chunks summarised by one section vector
+SECTION_CHUNKS = int(os.getenv("RAG_HIERARCHY_SECTION_CHUNKS", "8"))
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+class RoutingIndex:
+    """Section vectors grouped by document (sections of a document are contiguous)"""
+
+    def __init__(self, documents: Sequence[str], section_vectors: np.ndarray, section_starts: np.ndarray,
+                 row_starts: Optional[np.ndarray] = None):
+        import numpy as np
+
+        self.documents = list(documents)
+        self.section_vectors = section_vectors
+        # Index of each document's first section in section_vectors
+        self.section_starts = np.asarray(section_starts, dtype=np.int64)
+        # First chunk row of each document, when its chunks are stored contiguously (shared index)
+        self.row_starts = np.asarray(row_starts, dtype=np.int64) if row_starts is not None else None
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, sources: Sequence[str], positions: Sequence[int],
+              section_chunks: int = SECTION_CHUNKS) -> "RoutingIndex":
+        """Build from chunk vectors, their document names and their order within the document"""
+        import numpy as np
+
+        # Chroma returns embeddings as nested lists on older versions
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(sources):
+            dimension = vectors.shape[1] if vectors.ndim == 2 else 0
+            return cls([], np.zeros((0, dimension), dtype=np.float32), np.zeros(0, dtype=np.int64))
+
+        rows_by_document: Dict[str, List[int]] = {}
+        for row, source in enumerate(sources):
+            rows_by_document.setdefault(source, []).append(row)
+
+        documents, section_vectors, section_starts = [], [], []
+        for source, rows in rows_by_document.items():
+            rows.sort(key=lambda row: positions[row])
+            documents.append(source)
+            section_starts.append(len(section_vectors))
+            for start in range(0, len(rows), section_chunks):
+                section_vectors.append(vectors[rows[start:start + section_chunks]].mean(axis=0))
+
+        matrix = _normalize_rows(np.asarray(section_vectors, dtype=np.float32))
+        return cls(documents, matrix, np.asarray(section_starts))
+
+    def select(self, queries: np.ndarray, fanout: int = HIERARCHY_FANOUT) -> List[List[int]]:
+        """Indices of the top `fanout` documents for each normalised query"""
+        import numpy as np
+
+        if not self.documents:
+            return [[] for _ in queries]
+        section_scores = self.section_vectors @ queries.T  # (sections, queries)
+        document_scores = np.maximum.reduceat(section_scores, self.section_starts, axis=0)
+        fanout = min(fanout, len(self.documents))
+        top = np.argpartition(-document_scores, fanout - 1, axis=0)[:fanout]
+        return [
+            [int(document) for document in top[np.argsort(-document_scores[top[:, column], column]), column]]
+            for column in range(queries.shape[0])
+        ]
+
+    def save(self, path: str):
+        import numpy as np
+
+        arrays = {
+            "documents": np.asarray(self.documents, dtype=str),
+            "section_vectors": self.section_vectors,
+            "section_starts": self.section_starts
+        }
+        if self.row_starts is not None:
+            arrays["row_starts"] = self.row_starts
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "RoutingIndex":
+        import numpy as np
+
+        with np.load(path) as data:
+            return cls(
+                data["documents"].tolist(),
+                data["section_vectors"],
+                data["section_starts"],
+                data["row_starts"] if "row_starts" in data else None
+            )
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": len(self.documents), "sections": int(len(self.section_vectors))}
+
+def make_hierarchical_retriever(vectorstore, routing: RoutingIndex, embedding_model, k: int,
+                                fanout: int = HIERARCHY_FANOUT):
+    """LangChain retriever over Chroma that only searches the chunks of the routed documents"""
+    from langchain_core.retrievers import BaseRetriever
+    from langchain.schema import Document
+
+    class HierarchicalRetriever(BaseRetriever):
+        vectorstore: Any
+        routing: Any
+        embedding: Any
+        k: int = 5
+        fanout: int = 3
+
+        def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+            query_vector = self.embedding.embed_query(query)
+            return search_routed(self.vectorstore, self.routing, query_vector, self.k, self.fanout)
+
+    return HierarchicalRetriever(vectorstore=vectorstore, routing=routing, embedding=embedding_model,
+                                 k=k, fanout=fanout)
+
+def search_routed(vectorstore, routing: RoutingIndex, query_vector: List[float], k: int,
+                  fanout: int = HIERARCHY_FANOUT):
+    """Chroma similarity search restricted to the documents routing selects for the query.
+
+    The restriction is a `$in` filter applied while walking the full HNSW index,
+    so unlike the shared index this does not make the search cheaper.
+    """
+    import numpy as np
+
+    query = _normalize_rows(np.asarray([query_vector], dtype=np.float32))
+    sources = [routing.documents[document] for document in routing.select(query, fanout)[0]]
+    if not sources:
+        return vectorstore.similarity_search_by_vector(query_vector, k=k)
+    return vectorstore.similarity_search_by_vector(query_vector, k=k, filter={"source": {"$in": sources}})
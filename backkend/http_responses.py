@@ -0,0 +1,153 @@
+# HTTP Responses - fast JSON, negotiated compression and conditional GETs
+#
+# Routes with a response_model are serialized straight to JSON bytes by
+# Pydantic's Rust core (FastAPI >= 0.130). No custom default response class is
+# set on purpose: that would switch this fast path off. orjson covers the JSON
+# the app builds by hand (SSE events, NDJSON exports, /health).
+import os
+import gzip
+import asyncio
+import hashlib
+from typing import Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true"
+# Smaller bodies are sent as is (compression would not pay for its CPU and headers)
+COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Bodies this large are compressed in a worker thread instead of on the event loop
+THREAD_MIN_BYTES = 256 * 1024
+# Streamed token by token or line by line; never held back for compression
+STREAMING_TYPES = ("text/event-stream", "application/x-ndjson")
+INCOMPRESSIBLE_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip")
+
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def json_dumps(data) -> str:
+    return orjson.dumps(data, option=JSON_OPTIONS).decode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, for content that has no response model"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=JSON_OPTIONS)
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Preferred content coding the client accepts: br (if available), then gzip"""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip()] = weight
+
+    for coding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if weights.get(coding, weights.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """Compress complete responses above COMPRESSION_MIN_BYTES with br or gzip.
+
+    Only bodies sent in one message are compressed. SSE, NDJSON and any other
+    streamed response pass through untouched, so tokens still reach the
+    client as soon as they are produced.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        pending_start = None
+
+        async def send_compressed(message):
+            nonlocal pending_start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+                if ("content-encoding" in headers or message["status"] in (204, 206, 304)
+                        or media_type.startswith(STREAMING_TYPES + INCOMPRESSIBLE_TYPES)):
+                    await send(message)
+                else:
+                    # Hold the headers until the first body shows whether it is complete
+                    pending_start = message
+                return
+            if message["type"] != "http.response.body" or pending_start is None:
+                await send(message)
+                return
+
+            start, pending_start = pending_start, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) >= THREAD_MIN_BYTES:
+                body = await asyncio.to_thread(compress, body, coding)
+            else:
+                body = compress(body, coding)
+            headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # The encoded bytes differ from the ones a strong ETag describes
+                headers["ETag"] = "W/" + etag
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison (RFC 9110) of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+def conditional_json(request: Request, model) -> Response:
+    """Serialize a response model with an ETag; 304 Not Modified if the client has it already"""
+    body = model.model_dump_json().encode("utf-8")
+    etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+    # Per-user data: browsers may keep it but must revalidate, shared caches must not store it
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,293 @@
+# Ingestion - PDF text extraction and chunking shared by the API and build_index.py
+#
+# Plain functions (no model or LLM state) so they can run in worker processes.
+from __future__ import annotations
+
+import os
+import re
+import json
+import hashlib
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+# Chunking defaults; compare settings with evaluate_retrieval.py before changing them
+DEFAULT_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "800"))
+DEFAULT_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "100"))
+
+# Collapse near-duplicate chunks (reused slides, repeated definitions) at ingestion
+DEDUP_ENABLED = os.getenv("RAG_DEDUP", "true").lower() == "true"
+# Estimated Jaccard similarity of word shingles above which chunks are merged
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+# MinHash signature length and LSH bands (rows per band = MINHASH_PERMUTATIONS // LSH_BANDS)
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_WORDS = 5
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_PAGE_MARKER = re.compile(r"--- Lecture Page (\d+) ---")
+
+def extract_pages(pdf_path: str) -> List[Tuple[int, str]]:
+    """(page number, text) of every PDF page that has text"""
+    if not os.path.exists(pdf_path):
+        return []
+    
+    import fitz  # PyMuPDF
+    
+    doc = fitz.open(pdf_path)
+    pages = []
+    
+    for page_num in range(len(doc)):
+        page_text = doc[page_num].get_text()
+        if page_text.strip():
+            pages.append((page_num + 1, page_text))
+    
+    doc.close()
+    return pages
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """Extract text from PDF using PyMuPDF"""
+    return "".join(
+        f"\n\n--- Lecture Page {page_number} ---\n\n{page_text}"
+        for page_number, page_text in extract_pages(pdf_path)
+    )
+
+def create_overlapping_chunks(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                              chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[Document]:
+    """Split text into overlapping chunks (smaller chunks for faster processing)"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain.schema import Document
+    
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    
+    chunks = text_splitter.split_text(text)
+    
+    # Page markers inserted by extract_text_from_pdf, used to tag chunks with their pages
+    markers = [(match.start(), int(match.group(1))) for match in _PAGE_MARKER.finditer(text)]
+    marker_offsets = [offset for offset, _ in markers]
+    
+    def page_at(offset: int) -> int:
+        index = bisect_right(marker_offsets, offset) - 1
+        return markers[index][1] if index >= 0 else 1
+    
+    documents = []
+    position = 0
+    for i, chunk in enumerate(chunks):
+        # Chunks come back in order, overlapping only with their predecessor
+        found = text.find(chunk, position)
+        if found >= 0:
+            position = found + 1
+        else:
+            found = position
+        metadata = {
+            "chunk_id": i,
+            "source": "Unknown",
+            "chunk_size": len(chunk),
+            "content_type": "lecture_notes"
+        }
+        if markers:
+            metadata["page"] = page_at(found)
+            metadata["page_end"] = page_at(found + len(chunk) - 1)
+        documents.append(Document(page_content=chunk, metadata=metadata))
+    
+    return documents
+
+def chunk_pdf(pdf_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[Document]:
+    """Extract and chunk one PDF, tagging chunks with the file name as source"""
+    documents = create_overlapping_chunks(extract_text_from_pdf(pdf_path), chunk_size, chunk_overlap)
+    source = os.path.basename(pdf_path)
+    for doc in documents:
+        doc.metadata["source"] = source
+    return documents
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens used for lexical statistics"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+def lexical_stats(texts: List[str]) -> Dict[str, object]:
+    """Document frequencies and lengths for BM25-style lexical scoring"""
+    document_frequency: Dict[str, int] = {}
+    lengths = []
+    for text in texts:
+        tokens = tokenize(text)
+        lengths.append(len(tokens))
+        for token in set(tokens):
+            document_frequency[token] = document_frequency.get(token, 0) + 1
+    return {
+        "tokenizer": "lowercase-word",
+        "documents": len(texts),
+        "avg_length": sum(lengths) / len(lengths) if lengths else 0.0,
+        "lengths": lengths,
+        "document_frequency": document_frequency
+    }
+
+def _stable_hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _shingle_hashes(text: str) -> set:
+    """Stable 64-bit hashes of the word shingles of a text"""
+    tokens = tokenize(text)
+    if len(tokens) <= SHINGLE_WORDS:
+        return {_stable_hash64(" ".join(tokens))}
+    return {
+        _stable_hash64(" ".join(tokens[i:i + SHINGLE_WORDS]))
+        for i in range(len(tokens) - SHINGLE_WORDS + 1)
+    }
+
+def _mix64(values):
+    """splitmix64 finalizer: a bijective, well-mixed 64-bit hash (uint64 arithmetic wraps)"""
+    import numpy as np
+    
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def find_near_duplicates(texts: List[str], threshold: float = DEDUP_THRESHOLD, stored: int = 0) -> List[List[int]]:
+    """Group texts into clusters of near duplicates using MinHash signatures and LSH.
+
+    LSH only proposes candidate pairs; a text joins a cluster when the exact
+    Jaccard similarity of its shingles with the cluster's canonical member
+    (the longest text) reaches `threshold`. Returns every text exactly once
+    as a list of clusters (indices), canonical member first, ordered by the
+    position of that canonical member.
+    
+    The first `stored` texts are already indexed: each stays canonical of its
+    own cluster and only absorbs texts after them.
+    """
+    import numpy as np
+    
+    if not texts:
+        return []
+    
+    # One independent hash per permutation: the shingle hash XOR a random
+    # 64-bit seed, then mixed. Fixed seeds keep signatures identical in every process.
+    rng = np.random.RandomState(1)
+    seeds = rng.randint(0, 1 << 32, size=(MINHASH_PERMUTATIONS, 2)).astype(np.uint64)
+    seeds = (seeds[:, 0] << np.uint64(32)) | seeds[:, 1]
+    
+    shingles = [_shingle_hashes(text) for text in texts]
+    signatures = np.empty((len(texts), MINHASH_PERMUTATIONS), dtype=np.uint64)
+    for row, hashes in enumerate(shingles):
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        signatures[row] = _mix64(values[None, :] ^ seeds[:, None]).min(axis=1)
+    
+    def jaccard(first: int, second: int) -> float:
+        union = len(shingles[first] | shingles[second])
+        return len(shingles[first] & shingles[second]) / union if union else 1.0
+    
+    # Texts sharing any band are candidates; signature agreement is only a cheap
+    # prefilter, the exact shingle Jaccard decides
+    estimate_floor = max(0.0, threshold - 0.15)
+    rows_per_band = MINHASH_PERMUTATIONS // LSH_BANDS
+    neighbours: Dict[int, set] = {}
+    checked = set()
+    for band in range(LSH_BANDS):
+        buckets: Dict[bytes, List[int]] = {}
+        band_values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for row in range(len(texts)):
+            buckets.setdefault(band_values[row].tobytes(), []).append(row)
+        for members in buckets.values():
+            for position, first in enumerate(members):
+                for second in members[position + 1:]:
+                    if (first, second) in checked:
+                        continue
+                    checked.add((first, second))
+                    if (np.mean(signatures[first] == signatures[second]) >= estimate_floor
+                            and jaccard(first, second) >= threshold):
+                        neighbours.setdefault(first, set()).add(second)
+                        neighbours.setdefault(second, set()).add(first)
+    
+    # Longest texts become canonical first and absorb only their own near
+    # duplicates, so no chain of overlapping chunks collapses transitively
+    assigned = [False] * len(texts)
+    groups = []
+    order = list(range(stored)) + sorted(range(stored, len(texts)), key=lambda row: (-len(texts[row]), row))
+    for row in order:
+        if assigned[row]:
+            continue
+        group = [row] + sorted(
+            (other for other in neighbours.get(row, ()) if not assigned[other] and other >= stored),
+            key=lambda other: (-len(texts[other]), other)
+        )
+        for member in group:
+            assigned[member] = True
+        groups.append(group)
+    return sorted(groups, key=lambda group: group[0])
+
+def _location(metadata: Dict) -> Dict:
+    location = {"source": metadata.get("source", "Unknown"), "chunk_id": metadata.get("chunk_id")}
+    if "page" in metadata:
+        location["page"] = metadata["page"]
+        location["page_end"] = metadata.get("page_end", metadata["page"])
+    return location
+
+def _locations(metadata: Dict) -> List[Dict]:
+    # A chunk that already absorbed duplicates carries all their locations
+    if metadata.get("locations"):
+        return json.loads(metadata["locations"])
+    return [_location(metadata)]
+
+def merge_duplicate_metadata(metadatas: List[Dict]) -> Dict:
+    """Metadata of a canonical chunk (first) listing every location of its duplicates.
+
+    `locations` is a JSON string so it fits scalar-only metadata stores (Chroma).
+    """
+    merged = dict(metadatas[0])
+    if len(metadatas) > 1:
+        locations = [location for metadata in metadatas for location in _locations(metadata)]
+        merged["locations"] = json.dumps(locations)
+        merged["duplicates"] = len(locations) - 1
+    return merged
+
+def chunk_key(metadata: Dict) -> str:
+    """Identity of a stored chunk that survives reordering of the index"""
+    return f"{metadata.get('source', 'Unknown')}#{metadata.get('chunk_id')}"
+
+def deduplicate_chunks(documents: List[Document], threshold: float = DEDUP_THRESHOLD) -> List[Document]:
+    """Collapse near-duplicate chunks into one canonical chunk each"""
+    groups = find_near_duplicates([doc.page_content for doc in documents], threshold)
+    deduplicated = []
+    for group in groups:
+        canonical = documents[group[0]]
+        canonical.metadata = merge_duplicate_metadata([documents[row].metadata for row in group])
+        deduplicated.append(canonical)
+    if len(deduplicated) < len(documents):
+        print(f"Collapsed {len(documents) - len(deduplicated)} near-duplicate chunks "
+              f"({len(documents)} -> {len(deduplicated)})")
+    return deduplicated
+
+def deduplicate_against_stored(documents: List[Document], stored: List[Tuple[str, Dict]],
+                               threshold: float = DEDUP_THRESHOLD) -> Tuple[List[Document], Dict[str, Dict]]:
+    """Drop new chunks that near-duplicate chunks already in the index.
+
+    `stored` holds (text, metadata) of the indexed chunks. Returns the chunks
+    still to add and, by chunk_key, the new metadata of every stored chunk
+    that absorbed duplicates (their locations merged in).
+    """
+    texts = [text for text, _ in stored] + [doc.page_content for doc in documents]
+    kept, updates = [], {}
+    for group in find_near_duplicates(texts, threshold, stored=len(stored)):
+        canonical = group[0]
+        if canonical < len(stored):
+            if len(group) > 1:
+                metadata = stored[canonical][1]
+                updates[chunk_key(metadata)] = merge_duplicate_metadata(
+                    [metadata] + [documents[row - len(stored)].metadata for row in group[1:]]
+                )
+            continue
+        document = documents[canonical - len(stored)]
+        if len(group) > 1:
+            document.metadata = merge_duplicate_metadata([documents[row - len(stored)].metadata for row in group])
+        kept.append(document)
+    if len(kept) < len(documents):
+        print(f"Dropped {len(documents) - len(kept)} chunks already in the index "
+              f"({len(updates)} stored chunks gained locations)")
+    return kept, updates
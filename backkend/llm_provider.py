@@ -0,0 +1,314 @@
+# Async LLM provider - Gemini REST client with deadlines, retries and hedging
+import os
+import json
+import time
+import random
+import asyncio
+from collections import deque
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+# Point GEMINI_BASE_URL at a local fake server (see fake_gemini_server.py) for testing
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # overall deadline per call (seconds)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+# HTTP statuses worth retrying (rate limited or server side trouble)
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+# Of those, the ones where Gemini is rate limiting us or overloaded rather than slow
+OVERLOAD_STATUSES = {429, 503}
+
+class LLMProviderError(Exception):
+    """The LLM call failed and should not be retried"""
+
+class TransientLLMError(LLMProviderError):
+    """The LLM call failed in a way that may succeed on retry"""
+
+class LLMOverloadedError(TransientLLMError):
+    """Gemini rate limited the call or was overloaded (429/503)"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LatencyTracker:
+    """Rolling latency window and call counters for tail-latency monitoring"""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, object]:
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "samples": len(self.samples),
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99))
+        }
+
+class GeminiProvider:
+    """Native async Gemini client.
+
+    Every call gets an overall deadline, transient failures are retried with
+    jittered exponential backoff, and with hedging enabled a duplicate request
+    is sent once the first one is slower than the observed p95 (the first
+    response wins). One pooled HTTP client is reused per event loop.
+    """
+
+    def __init__(self, api_key: str, model: str = GEMINI_MODEL, base_url: str = GEMINI_BASE_URL,
+                 temperature: float = 0.7, max_output_tokens: int = 1200,
+                 timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES,
+                 hedging: bool = LLM_HEDGING):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedging = hedging
+        self.metrics = LatencyTracker()
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._client_loop = None
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        import httpx  # deferred: only needed once the first LLM call is made
+
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._client_loop is not loop:
+            self._close_on_own_loop(self._client, self._client_loop)
+            self._client = None
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS
+                ),
+                headers={"x-goog-api-key": self.api_key}
+            )
+            self._client_loop = loop
+        return self._client
+
+    @staticmethod
+    def _close_on_own_loop(client: "httpx.AsyncClient", loop: asyncio.AbstractEventLoop):
+        """Close a client left over from another event loop (its connections belong to that loop)"""
+        if loop.is_closed():
+            # Nothing can drive its transports any more; their sockets close when collected
+            return
+        # Runs now if that loop is running in another thread, otherwise when it runs next
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    async def aclose(self):
+        if self._client is not None:
+            if self._client_loop is asyncio.get_running_loop():
+                await self._client.aclose()
+            else:
+                self._close_on_own_loop(self._client, self._client_loop)
+            self._client = None
+            self._client_loop = None
+
+    def _payload(self, prompt: str) -> Dict:
+        return {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": self.temperature,
+                "maxOutputTokens": self.max_output_tokens
+            }
+        }
+
+    @staticmethod
+    def _extract_text(body: Dict) -> str:
+        candidates = body.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    @staticmethod
+    def _retry_after(response: "httpx.Response") -> float:
+        try:
+            return max(0.0, float(response.headers.get("retry-after", "")))
+        except ValueError:
+            # Missing or an HTTP date: suggest waiting as long as our own last backoff
+            return LLM_RETRY_BACKOFF * (2 ** LLM_MAX_RETRIES)
+
+    @classmethod
+    def _raise_for_status(cls, response: "httpx.Response"):
+        if response.status_code in OVERLOAD_STATUSES:
+            raise LLMOverloadedError(f"Gemini returned {response.status_code}", cls._retry_after(response))
+        if response.status_code in TRANSIENT_STATUSES:
+            raise TransientLLMError(f"Gemini returned {response.status_code}")
+        if response.status_code >= 400:
+            raise LLMProviderError(f"Gemini returned {response.status_code}: {response.text[:200]}")
+
+    async def _call_once(self, prompt: str) -> str:
+        import httpx
+
+        client = self._get_client()
+        try:
+            response = await client.post(
+                f"{self.base_url}/models/{self.model}:generateContent",
+                json=self._payload(prompt)
+            )
+        except (httpx.TransportError, httpx.TimeoutException) as e:
+            raise TransientLLMError(f"Gemini request failed: {e!r}")
+        self._raise_for_status(response)
+        return self._extract_text(response.json())
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, LLM_RETRY_BACKOFF * (2 ** attempt))
+
+    async def _call_with_retries(self, prompt: str) -> str:
+        attempt = 0
+        while True:
+            try:
+                return await self._call_once(prompt)
+            except TransientLLMError:
+                if attempt >= self.max_retries:
+                    raise
+                self.metrics.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedging or len(self.metrics.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY, self.metrics.percentile(95))
+
+    async def _call_hedged(self, prompt: str, delay: float) -> str:
+        primary = asyncio.ensure_future(self._call_with_retries(prompt))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.metrics.hedges += 1
+            hedge = asyncio.ensure_future(self._call_with_retries(prompt))
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The losing request (or both, on deadline) is abandoned
+            for task in pending:
+                task.cancel()
+
+    async def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Generate a complete answer within the deadline"""
+        self.metrics.calls += 1
+        started = time.perf_counter()
+        delay = self._hedge_delay()
+        try:
+            call = self._call_hedged(prompt, delay) if delay is not None else self._call_with_retries(prompt)
+            text = await asyncio.wait_for(call, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts += 1
+            self.metrics.errors += 1
+            raise TransientLLMError(f"Gemini did not answer within {timeout or self.timeout:.0f}s")
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        self.metrics.record(time.perf_counter() - started)
+        return text
+
+    async def stream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Stream answer text chunks. Retries happen only before the first chunk arrives."""
+        self.metrics.calls += 1
+        started = time.perf_counter()
+        deadline = started + (timeout or self.timeout)
+        import httpx
+
+        client = self._get_client()
+        attempt = 0
+
+        while True:
+            received_any = False
+            try:
+                async with client.stream(
+                    "POST",
+                    f"{self.base_url}/models/{self.model}:streamGenerateContent",
+                    params={"alt": "sse"},
+                    json=self._payload(prompt)
+                ) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                    self._raise_for_status(response)
+
+                    lines = response.aiter_lines()
+                    while True:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            line = await asyncio.wait_for(lines.__anext__(), remaining)
+                        except StopAsyncIteration:
+                            break
+                        if not line.startswith("data:"):
+                            continue
+                        text = self._extract_text(json.loads(line[5:].strip()))
+                        if text:
+                            received_any = True
+                            yield text
+                self.metrics.record(time.perf_counter() - started)
+                return
+            except asyncio.TimeoutError:
+                self.metrics.timeouts += 1
+                self.metrics.errors += 1
+                raise TransientLLMError(f"Gemini stream did not finish within {timeout or self.timeout:.0f}s")
+            except (httpx.TransportError, httpx.TimeoutException, TransientLLMError) as e:
+                if received_any or attempt >= self.max_retries or time.perf_counter() >= deadline:
+                    self.metrics.errors += 1
+                    if isinstance(e, LLMOverloadedError):
+                        raise
+                    raise TransientLLMError(f"Gemini stream failed: {e!r}")
+                self.metrics.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+            except Exception:
+                self.metrics.errors += 1
+                raise
+
+    def stats(self) -> Dict[str, object]:
+        return {"model": self.model, "hedging": self.hedging, **self.metrics.snapshot()}
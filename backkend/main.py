@@ -1,17 +1,57 @@
 # FastAPI Main Application
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
-from routes import router
-from user_routes import router as user_router
-from database import connect_to_mongo, close_mongo_connection
+import startup_profile  # first, so every later phase is timed
+
+import os
+import asyncio
+
+with startup_profile.phase("import:fastapi"):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+    from fastapi.middleware.cors import CORSMiddleware
+    from contextlib import asynccontextmanager
+
+with startup_profile.phase("import:routes"):
+    # RAG dependencies (LangChain, torch, Chroma) are not imported here, see service.py
+    from routes import router, loaded_rag_service, shutdown_rag_service, warm_up_rag_service
+    from user_routes import router as user_router
+    from chat_routes import router as chat_router
+    from rate_limit import llm_admission
+    from coalesce import ask_flights, ask_stream_flights
+    from database import (
+        connect_to_mongo, close_mongo_connection, get_database_health, chat_history_writer,
+        DB_UNAVAILABLE_ERRORS
+    )
+    from diagnostics import DIAGNOSTICS_ENABLED
+    from http_responses import COMPRESSION_ENABLED, CompressionMiddleware, FastJSONResponse
+
+# Load the RAG stack in the background after startup instead of on the first /ask
+RAG_WARMUP = os.getenv("RAG_WARMUP", "true").lower() == "true"
+
+async def _warm_up():
+    try:
+        with startup_profile.phase("warmup:rag"):
+            await asyncio.to_thread(warm_up_rag_service)
+    except Exception as e:
+        print(f"RAG warm-up failed (will retry on first request): {e}")
+    startup_profile.log_report()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await connect_to_mongo()
+    with startup_profile.phase("startup:mongo"):
+        await connect_to_mongo()
+    await chat_history_writer.start()
+    startup_profile.mark("ready")
+    
+    warm_up_task = asyncio.create_task(_warm_up()) if RAG_WARMUP else None
+    if not RAG_WARMUP:
+        startup_profile.log_report()
     yield
     # Shutdown
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    await chat_history_writer.stop()
+    await shutdown_rag_service()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -28,11 +68,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+if COMPRESSION_ENABLED:
+    # gzip/br for complete responses only; SSE and NDJSON streams are never buffered
+    app.add_middleware(CompressionMiddleware)
+
+# Database outages are temporary: tell clients to retry instead of failing with 500
+async def database_unavailable_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable, please retry"},
+        headers={"Retry-After": "5"}
+    )
+
+for error_class in DB_UNAVAILABLE_ERRORS:
+    app.add_exception_handler(error_class, database_unavailable_handler)
+
 # Include routes
 app.include_router(router)
 app.include_router(user_router)
+app.include_router(chat_router)
+
+if DIAGNOSTICS_ENABLED:
+    # Admin-only profiler and memory endpoints; not mounted at all when disabled
+    from admin_routes import router as admin_router
+    app.include_router(admin_router)
 
 @app.get("/")
 async def root():
@@ -44,10 +106,34 @@ async def root():
             "GET /api/auth/me - Get current user info",
             "POST /api/rag/init-db - Initialize ChromaDB with PDFs",
             "POST /api/rag/add-pdf - Add PDFs to existing ChromaDB", 
-            "POST /api/rag/ask - Ask questions using RAG"
+            "POST /api/rag/ask - Ask questions using RAG",
+            "POST /api/rag/ask/stream - Ask questions with a streamed (SSE) answer",
+            "POST /api/rag/ask/batch - Answer many questions at once (NDJSON, completion order)",
+            "GET /api/chat/sessions - List saved chat sessions",
+            "GET /api/chat/sessions/{session_id}/messages - Get messages of a session",
+            "GET /health - Service and database health"
         ]
     }
 
+@app.get("/health")
+async def health():
+    database = get_database_health()
+    rag_service = loaded_rag_service()
+    return FastJSONResponse(
+        status_code=200 if database["healthy"] else 503,
+        content={
+            "status": "ok" if database["healthy"] else "degraded",
+            "database": database,
+            "chat_history": chat_history_writer.stats(),
+            "llm_admission": llm_admission.stats(),
+            "coalescing": {"ask": ask_flights.stats(), "ask_stream": ask_stream_flights.stats()},
+            "llm": rag_service.llm_provider.stats() if rag_service and rag_service.llm_provider else None,
+            "rag_loaded": rag_service is not None,
+            "shared_index": rag_service.shared_index.stats() if rag_service and rag_service.shared_index else None,
+            "startup": startup_profile.report()
+        }
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
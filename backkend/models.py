@@ -1,6 +1,6 @@
 # Pydantic Models for API requests and responses
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, validator
+from typing import List, Optional
 
 class InitDBRequest(BaseModel):
     pdf_paths: List[str]
@@ -22,13 +22,36 @@ class AddPDFResponse(BaseModel):
 
 class AskRequest(BaseModel):
     question: str
+    session_id: Optional[str] = None
+
+class AskBatchRequest(BaseModel):
+    questions: List[str]
+    session_id: Optional[str] = None
+    
+    @validator('questions')
+    def validate_questions(cls, v):
+        questions = [question.strip() for question in v]
+        if not questions or not all(questions):
+            raise ValueError('Provide at least one question and no empty questions')
+        return questions
 
 class SourceDocument(BaseModel):
     source: str
     chunk_id: str
     content_preview: str
+    locations: Optional[List[str]] = None  # every place a deduplicated passage appears
 
 class AskResponse(BaseModel):
     answer: str
     sources: List[SourceDocument]
     conversation_length: int
+    session_id: Optional[str] = None
+
+class AskBatchItem(BaseModel):
+    """One line of the /ask/batch NDJSON stream"""
+    index: int
+    question: str
+    answer: Optional[str] = None
+    sources: List[SourceDocument] = []
+    error: Optional[str] = None
+    session_id: Optional[str] = None
@@ -0,0 +1,244 @@
+# Rate limiting and admission control for LLM-backed endpoints
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+from pymongo import ReturnDocument
+
+from auth import get_optional_user_id
+from database import db
+
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "true").lower() == "true"
+# "memory" keeps buckets per process, "mongo" shares them between workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Only trust X-Forwarded-For when running behind a known reverse proxy
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() == "true"
+
+# Global cap on in-flight LLM calls
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token bucket: `capacity` requests burst, refilled at `refill_rate` per second"""
+    capacity: float
+    refill_rate: float
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """Parse "20/minute" or "20/60" (requests per N seconds)"""
+        count, period = value.strip().split("/", 1)
+        seconds = _PERIODS.get(period.strip().lower()) or float(period)
+        return cls(capacity=float(count), refill_rate=float(count) / seconds)
+
+class InMemoryRateLimitBackend:
+    """Per-process token buckets (no cross-worker sharing)"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (tokens, updated, full_at), least recently used first
+        self.buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+
+    async def acquire(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        """Take one token. Returns (allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        tokens, updated, _ = self.buckets.get(key, (limit.capacity, now, now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Each bucket remembers when its own limit will have refilled it
+        self.buckets[key] = (tokens, now, now + (limit.capacity - tokens) / limit.refill_rate)
+        self.buckets.move_to_end(key)
+
+        if len(self.buckets) > self.max_keys:
+            self._evict(now)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / limit.refill_rate
+
+    def _evict(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        for key in [key for key, (_, _, full_at) in self.buckets.items() if full_at <= now]:
+            del self.buckets[key]
+        # Still too many active buckets: drop the least recently used. Leaving
+        # 10% headroom keeps the sweep from running again on the next request.
+        while len(self.buckets) > self.max_keys * 0.9:
+            self.buckets.popitem(last=False)
+
+class MongoRateLimitBackend:
+    """Token buckets stored in MongoDB so all workers share the same limits.
+
+    Each check is a single atomic find_one_and_update with an aggregation
+    pipeline; idle buckets are removed by a TTL index on expires_at.
+    """
+
+    def __init__(self, collection_name: str = "rate_limits"):
+        self.collection_name = collection_name
+        self.fallback = InMemoryRateLimitBackend()
+
+    async def acquire(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        if db.database is None:
+            return await self.fallback.acquire(key, limit)
+
+        now = time.time()
+        idle_expiry = datetime.utcnow() + timedelta(seconds=limit.capacity / limit.refill_rate)
+        pipeline = [
+            {"$set": {
+                "tokens": {"$min": [
+                    limit.capacity,
+                    {"$add": [
+                        {"$ifNull": ["$tokens", limit.capacity]},
+                        {"$multiply": [
+                            {"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated", now]}]}]},
+                            limit.refill_rate
+                        ]}
+                    ]}
+                ]},
+                "updated": now
+            }},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "expires_at": idle_expiry
+            }}
+        ]
+
+        try:
+            bucket = await db.database[self.collection_name].find_one_and_update(
+                {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            # Fail open to per-process limits rather than rejecting traffic
+            print(f"Rate limit backend error, using in-process buckets: {e}")
+            return await self.fallback.acquire(key, limit)
+
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, (1 - bucket["tokens"]) / limit.refill_rate
+
+def _create_backend():
+    if RATE_LIMIT_BACKEND == "mongo":
+        return MongoRateLimitBackend()
+    return InMemoryRateLimitBackend()
+
+# Global rate limit backend
+rate_limit_backend = _create_backend()
+
+def get_client_ip(request: Request) -> str:
+    """Client address, honouring X-Forwarded-For only behind a trusted proxy"""
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def _limit_from_env(endpoint: str, scope: str, default: Optional[str]) -> Optional[RateLimit]:
+    value = os.getenv(f"RATE_LIMIT_{endpoint.upper()}_{scope}", default)
+    if not value or value.lower() == "off":
+        return None
+    return RateLimit.parse(value)
+
+def rate_limit(endpoint: str, per_user: Optional[str] = None, per_ip: Optional[str] = None):
+    """Create a dependency enforcing per-user and per-IP token buckets for an endpoint.
+
+    Defaults can be overridden with RATE_LIMIT_<ENDPOINT>_USER / RATE_LIMIT_<ENDPOINT>_IP
+    (e.g. RATE_LIMIT_ASK_USER="20/minute", or "off" to disable).
+    """
+    user_limit = _limit_from_env(endpoint, "USER", per_user)
+    ip_limit = _limit_from_env(endpoint, "IP", per_ip)
+
+    async def check_rate_limit(request: Request, user_id: Optional[str] = Depends(get_optional_user_id)):
+        if not RATE_LIMITS_ENABLED:
+            return
+
+        checks = []
+        if user_id and user_limit:
+            checks.append((f"{endpoint}:user:{user_id}", user_limit))
+        if ip_limit:
+            checks.append((f"{endpoint}:ip:{get_client_ip(request)}", ip_limit))
+
+        for key, limit in checks:
+            allowed, retry_after = await rate_limit_backend.acquire(key, limit)
+            if not allowed:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Rate limit exceeded, please slow down",
+                    headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+                )
+
+    return check_rate_limit
+
+class AdmissionRejected(Exception):
+    """Raised when the LLM concurrency cap and its wait queue are both full"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Server is busy, please retry")
+        self.retry_after = retry_after
+
+class LLMAdmission:
+    """Caps in-flight LLM calls, queues a bounded number of waiters and sheds the rest"""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one LLM slot for the duration of the block"""
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            self.shed += 1
+            raise AdmissionRejected(retry_after=self.queue_timeout)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise AdmissionRejected(retry_after=self.queue_timeout)
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
+
+# Global LLM admission controller
+llm_admission = LLMAdmission()
+
+def admission_rejected_exception(exc: AdmissionRejected) -> HTTPException:
+    """HTTP 503 with Retry-After for a shed request"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(exc),
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))}
+    )
@@ -1,23 +1,117 @@
 # FastAPI Routes
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import os
+import asyncio
+import threading
+import uuid
 from models import (
     InitDBRequest, InitDBResponse,
     AddPDFRequest, AddPDFResponse, 
-    AskRequest, AskResponse, SourceDocument
+    AskRequest, AskResponse, SourceDocument,
+    AskBatchRequest, AskBatchItem
 )
 from service import RAGService
+from auth import get_optional_user_id
+from database import chat_history_writer
+from rate_limit import rate_limit, llm_admission, AdmissionRejected, admission_rejected_exception
+from coalesce import ask_flights, ask_stream_flights
+from llm_provider import LLMOverloadedError, TransientLLMError
+from summaries import SUMMARIES_ENABLED
+from http_responses import json_dumps
 
 router = APIRouter(prefix="/api/rag", tags=["RAG"])
 
+# Questions accepted by one /ask/batch call and LLM generations it runs at once
+BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", str(llm_admission.max_concurrency)))
+
+_rag_service: Optional[RAGService] = None
+_rag_service_lock = threading.Lock()
+
 def get_rag_service() -> RAGService:
-    return RAGService()
+    """Process-wide RAG service (model, vector store and session memories are shared).
+    
+    Created on first use, which loads the embedding model and LLM clients.
+    """
+    global _rag_service
+    if _rag_service is None:
+        with _rag_service_lock:
+            if _rag_service is None:
+                _rag_service = RAGService()
+    return _rag_service
+
+def warm_up_rag_service():
+    """Create the RAG service and load the vector store ahead of the first request"""
+    rag_service = get_rag_service()
+    if not rag_service.vectorstore:
+        rag_service.load_vectorstore()
+    # One embedding pass initialises the model's lazy state
+    rag_service.embedding_model.embed_query("warm up")
+
+def loaded_rag_service() -> Optional[RAGService]:
+    """The RAG service if it has been created (without creating it)"""
+    return _rag_service
+
+async def shutdown_rag_service():
+    """Release pooled LLM connections"""
+    if _rag_service is not None and _rag_service.llm_provider is not None:
+        await _rag_service.llm_provider.aclose()
+
+def _ensure_vectorstore(rag_service: RAGService):
+    """Load existing vector store if not already loaded (raises HTTPException)"""
+    if not rag_service.vectorstore:
+        loaded = rag_service.load_vectorstore()
+        if not loaded:
+            raise HTTPException(
+                status_code=400,
+                detail="No ChromaDB found. Use /init-db first to create knowledge base."
+            )
+
+def _ensure_ready(request: AskRequest, rag_service: RAGService):
+    """Load the vector store and validate the question (raises HTTPException)"""
+    _ensure_vectorstore(rag_service)
+    
+    # Validate question
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Question cannot be empty"
+        )
+
+def _resolve_session(request: AskRequest, user_id: Optional[str]):
+    """Return (session_id, memory key); signed-in users always get a session"""
+    session_id = request.session_id
+    if user_id and not session_id:
+        session_id = uuid.uuid4().hex
+    if not session_id:
+        return None, None
+    owner = user_id or "anonymous"
+    return session_id, f"{owner}:{session_id}"
 
-@router.post("/init-db", response_model=InitDBResponse, status_code=201)
-async def init_db(request: InitDBRequest, rag_service: RAGService = Depends(get_rag_service)):
+def _llm_overloaded_exception(exc: LLMOverloadedError) -> HTTPException:
+    """HTTP 503 with Retry-After once Gemini's 429/503 outlasted our retries"""
+    return HTTPException(
+        status_code=503,
+        detail=f"LLM is overloaded, please retry: {str(exc)}",
+        headers={"Retry-After": str(max(1, int(exc.retry_after + 0.999)))}
+    )
+
+@router.post(
+    "/init-db", response_model=InitDBResponse, status_code=201,
+    dependencies=[Depends(rate_limit("init_db", per_user="5/hour", per_ip="10/hour"))]
+)
+async def init_db(
+    request: InitDBRequest,
+    background_tasks: BackgroundTasks,
+    rag_service: RAGService = Depends(get_rag_service)
+):
     """
     POST /init-db
     Input: 1+ PDFs
     Action: Create ChromaDB if it doesn't exist, Add PDFs into it
+    (and build lecture summaries in the background when RAG_SUMMARIES is on)
     Output: confirmation
     """
     try:
@@ -32,6 +126,9 @@ async def init_db(request: InitDBRequest, rag_service: RAGService = Depends(get_
         # Create vector store
         rag_service.create_vectorstore(documents)
         
+        if SUMMARIES_ENABLED:
+            background_tasks.add_task(rag_service.build_summaries, request.pdf_paths, True)
+        
         return InitDBResponse(
             status="success",
             message="ChromaDB initialized successfully with PDFs",
@@ -39,15 +136,25 @@ async def init_db(request: InitDBRequest, rag_service: RAGService = Depends(get_
             chunks_created=len(documents)
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error initializing database: {str(e)}")
 
-@router.post("/add-pdf", response_model=AddPDFResponse)
-async def add_pdf(request: AddPDFRequest, rag_service: RAGService = Depends(get_rag_service)):
+@router.post(
+    "/add-pdf", response_model=AddPDFResponse,
+    dependencies=[Depends(rate_limit("add_pdf", per_user="10/hour", per_ip="20/hour"))]
+)
+async def add_pdf(
+    request: AddPDFRequest,
+    background_tasks: BackgroundTasks,
+    rag_service: RAGService = Depends(get_rag_service)
+):
     """
     POST /add-pdf
     Input: 1+ PDFs
     Action: Load persisted Chroma, Add new PDFs, Persist again
+    (and summarize them in the background when RAG_SUMMARIES is on)
     Output: confirmation
     """
     try:
@@ -71,62 +178,246 @@ async def add_pdf(request: AddPDFRequest, rag_service: RAGService = Depends(get_
                 detail="No valid content found in provided PDFs"
             )
         
-        # Add to existing vector store
-        rag_service.add_to_vectorstore(new_documents)
+        # Add to existing vector store (chunks already indexed only add their locations)
+        added = rag_service.add_to_vectorstore(new_documents)
+        
+        if SUMMARIES_ENABLED:
+            background_tasks.add_task(rag_service.build_summaries, request.pdf_paths)
         
         return AddPDFResponse(
             status="success",
             message="PDFs added to existing ChromaDB successfully",
-            new_documents_added=len(new_documents),
+            new_documents_added=added,
             total_documents=rag_service.get_document_count()
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding PDFs: {str(e)}")
 
-@router.post("/ask", response_model=AskResponse)
-async def ask(request: AskRequest, rag_service: RAGService = Depends(get_rag_service)):
+@router.post(
+    "/ask", response_model=AskResponse,
+    dependencies=[Depends(rate_limit("ask", per_user="20/minute", per_ip="60/minute"))]
+)
+async def ask(
+    request: AskRequest,
+    rag_service: RAGService = Depends(get_rag_service),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
     """
     POST /ask
-    Input: question text
-    Action: Load persisted Chroma, Query with RAG chain
+    Input: question text (+ optional session_id)
+    Action: Load persisted Chroma, retrieve context and generate the answer with Gemini
     Output: answer + sources
+    Signed-in users get the exchange saved to their chat history (batched, off the response path).
     """
     try:
-        # Load existing vector store if not already loaded
-        if not rag_service.vectorstore:
-            loaded = rag_service.load_vectorstore()
-            if not loaded:
-                raise HTTPException(
-                    status_code=400,
-                    detail="No ChromaDB found. Use /init-db first to create knowledge base."
-                )
+        _ensure_ready(request, rag_service)
+        session_id, memory_key = _resolve_session(request, user_id)
+        chat_history = rag_service.get_chat_history(memory_key)
         
-        # Validate question
-        if not request.question.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="Question cannot be empty"
-            )
+        async def generate():
+            # Bounded number of concurrent LLM calls
+            async with llm_admission.slot():
+                return await rag_service.aanswer_question(request.question, chat_history)
         
-        # Get answer from RAG
-        result = rag_service.ask_question(request.question)
+        # Overview questions ("summarize lecture 5") come from precomputed summaries
+        result = rag_service.summary_answer(request.question)
+        if result is None:
+            # Identical concurrent questions (same history and index version) share one generation
+            key = rag_service.coalesce_key(request.question, chat_history)
+            result = await ask_flights.do(key, generate)
+        conversation_length = rag_service.remember(memory_key, request.question, result["answer"])
         
         # Convert sources to response model
-        sources = [
-            SourceDocument(
-                source=src["source"],
-                chunk_id=src["chunk_id"],
-                content_preview=src["content_preview"]
+        sources = [SourceDocument(**src) for src in result["sources"]]
+        
+        if user_id:
+            chat_history_writer.enqueue(
+                user_id=user_id,
+                session_id=session_id,
+                question=request.question,
+                answer=result["answer"],
+                sources=result["sources"]
             )
-            for src in result["sources"]
-        ]
         
         return AskResponse(
             answer=result["answer"],
             sources=sources,
-            conversation_length=result["conversation_length"]
+            conversation_length=conversation_length,
+            session_id=session_id
+        )
+        
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise admission_rejected_exception(e)
+    except LLMOverloadedError as e:
+        raise _llm_overloaded_exception(e)
+    except TransientLLMError as e:
+        raise HTTPException(status_code=504, detail=f"LLM did not respond in time: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+
+@router.post(
+    "/ask/batch",
+    dependencies=[Depends(rate_limit("ask_batch", per_user="5/minute", per_ip="10/minute"))]
+)
+async def ask_batch(
+    request: AskBatchRequest,
+    rag_service: RAGService = Depends(get_rag_service),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """
+    POST /ask/batch
+    Input: list of standalone questions (+ optional session_id)
+    Action: Embed all questions in one batch, retrieve with one matrix query,
+    then generate answers with bounded concurrency
+    Output: NDJSON, one AskBatchItem per question in completion order
+    (`index` is the position in the request; failed questions carry `error`)
+    """
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch"
         )
+    
+    try:
+        _ensure_vectorstore(rag_service)
+        # One embedding batch and one vector search for the whole request
+        contexts = await asyncio.to_thread(rag_service.retrieve_batch, request.questions)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving context: {str(e)}")
+    
+    session_id, _ = _resolve_session(request, user_id)
+    concurrency = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def answer(index: int, question: str, source_documents: list) -> AskBatchItem:
+        async def generate():
+            async with llm_admission.slot():
+                return await rag_service.aanswer_with_context(question, source_documents)
         
+        async with concurrency:
+            try:
+                # Shares generations with identical /ask calls and repeats inside the batch
+                result = await ask_flights.do(rag_service.coalesce_key(question, []), generate)
+            except AdmissionRejected as e:
+                return AskBatchItem(index=index, question=question, error=str(e), session_id=session_id)
+            except LLMOverloadedError as e:
+                return AskBatchItem(index=index, question=question,
+                                    error=_llm_overloaded_exception(e).detail, session_id=session_id)
+            except TransientLLMError as e:
+                return AskBatchItem(index=index, question=question,
+                                    error=f"LLM did not respond in time: {str(e)}", session_id=session_id)
+            except Exception as e:
+                return AskBatchItem(index=index, question=question,
+                                    error=f"Error processing question: {str(e)}", session_id=session_id)
+        
+        if user_id:
+            chat_history_writer.enqueue(
+                user_id=user_id,
+                session_id=session_id,
+                question=question,
+                answer=result["answer"],
+                sources=result["sources"]
+            )
+        return AskBatchItem(
+            index=index,
+            question=question,
+            answer=result["answer"],
+            sources=[SourceDocument(**src) for src in result["sources"]],
+            session_id=session_id
+        )
+    
+    async def lines():
+        tasks = [
+            asyncio.ensure_future(answer(index, question, source_documents))
+            for index, (question, source_documents) in enumerate(zip(request.questions, contexts))
+        ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                item = await completed
+                yield item.model_dump_json() + "\n"
+        finally:
+            # Client went away: stop generating the remaining answers
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+@router.post(
+    "/ask/stream",
+    dependencies=[Depends(rate_limit("ask", per_user="20/minute", per_ip="60/minute"))]
+)
+async def ask_stream(
+    request: AskRequest,
+    rag_service: RAGService = Depends(get_rag_service),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """
+    POST /ask/stream
+    Input: question text (+ optional session_id)
+    Output: Server-Sent Events: `token` events with answer text, then one `done`
+    event with sources and session_id (or an `error` event)
+    """
+    try:
+        _ensure_ready(request, rag_service)
+        precomputed = rag_service.summary_answer(request.question)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+    
+    session_id, memory_key = _resolve_session(request, user_id)
+    chat_history = rag_service.get_chat_history(memory_key)
+    
+    async def produce(flight):
+        if precomputed is not None:
+            # Answered from precomputed summaries, no LLM call
+            flight.publish(("token", precomputed["answer"]))
+            flight.publish(("sources", precomputed["sources"]))
+            return
+        async with llm_admission.slot():
+            async for event in rag_service.astream_answer(request.question, chat_history):
+                flight.publish(event)
+    
+    # Identical concurrent questions attach to the same token stream
+    key = rag_service.coalesce_key(request.question, chat_history)
+    flight = ask_stream_flights.join(key, produce)
+    
+    async def events():
+        tokens = []
+        async for event, data in flight.subscribe():
+            if event == "token":
+                tokens.append(data)
+                yield _sse("token", {"text": data})
+            elif event == "sources":
+                answer = "".join(tokens)
+                conversation_length = rag_service.remember(memory_key, request.question, answer)
+                if user_id:
+                    chat_history_writer.enqueue(
+                        user_id=user_id,
+                        session_id=session_id,
+                        question=request.question,
+                        answer=answer,
+                        sources=data
+                    )
+                yield _sse("done", {
+                    "sources": data,
+                    "conversation_length": conversation_length,
+                    "session_id": session_id
+                })
+            elif event == "error":
+                yield _sse("error", {"detail": data})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,129 +1,204 @@
 # RAG Service - Core RAG functionality
-import fitz  # PyMuPDF
+#
+# Heavy dependencies (PyMuPDF, LangChain, Chroma, sentence-transformers/torch)
+# are imported where they are first used, so importing this module costs
+# almost nothing for processes that only serve auth endpoints.
+from __future__ import annotations
+
 import os
-from typing import List, Dict, Optional
+import re
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain.schema import Document
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferWindowMemory
+import ingestion
+from summaries import SummaryStore
+from hierarchy import HIERARCHICAL_ENABLED, RoutingIndex, make_hierarchical_retriever, search_routed
+from llm_provider import GeminiProvider
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+    from langchain.memory import ConversationBufferWindowMemory
 
 # Load environment variables
 load_dotenv()
 
+# Conversation memories kept per chat session (least recently used are dropped)
+MAX_SESSION_MEMORIES = int(os.getenv("RAG_MAX_SESSION_MEMORIES", "1000"))
+# Chunks retrieved per question; compare settings with evaluate_retrieval.py
+RETRIEVAL_K = int(os.getenv("RAG_TOP_K", "5"))
+
+# Rewrites a follow-up into a standalone question (LangChain's CONDENSE_QUESTION_PROMPT)
+CONDENSE_QUESTION_TEMPLATE = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
+
+Chat History:
+{chat_history}
+Follow Up Input: {question}
+Standalone question:"""
+
+QA_PROMPT_TEMPLATE = """You are an expert assistant for software engineering courses such as Distributed Systems, Software Metrics, and related subjects.
+
+You will be given a QUESTION and some CONTEXT extracted from course materials (lecture notes, slides, PDFs, textbooks).
+
+Instructions:
+- Always use the CONTEXT as the starting point of your answer.  
+- If the CONTEXT provides only names, terms, or short points, then expand each one in detail using your own knowledge (definitions, purpose, examples, pros/cons).  
+- If the CONTEXT provides some explanation but not enough detail, merge the given explanation with your own knowledge to produce a richer, more complete answer.  
+- If the CONTEXT is completely empty or irrelevant, say:  
+  "Dont say you dont have in context.  
+- Always explain thoroughly, not in one line. Use structured formats:
+  - Definitions (if applicable)  
+  - Key points or steps  
+  - Additional elaboration/examples from your knowledge  
+- Make sure the answer is clear, detailed, and student-friendly for exam preparation.
+
+---
+
+CONTEXT:
+{context}
+
+QUESTION:
+{question}
+
+ANSWER:
+zna-jeny-ihn"""
+
 class RAGService:
     def __init__(self):
         self.persist_directory = "./chroma_db"
-        # Use a smaller, faster embedding model
-        self.embedding_model = SentenceTransformerEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            cache_folder="./models_cache"  # Cache models locally
-        )
+        from shared_index import SharedVectorIndex, SHARED_INDEX_DIR, get_embedding_model
+        
+        # Use a smaller, faster embedding model (one copy per process, see shared_index)
+        self.embedding_model = get_embedding_model()
+        # Multi-worker mode: memory-mapped snapshots replace the Chroma client
+        self.shared_index = SharedVectorIndex(SHARED_INDEX_DIR) if SHARED_INDEX_DIR else None
         self.vectorstore = None
+        # Section vectors that route questions to a few lectures (Chroma mode, see hierarchy.py)
+        self.routing: Optional[RoutingIndex] = None
         self.retriever = None
-        self.llm = None
-        self.rag_chain = None
-        self.memory = None
+        self.llm_provider = None
+        # Precomputed lecture summaries for overview questions (see summaries.py)
+        self.summaries = SummaryStore()
+        self.memories: "OrderedDict[str, ConversationBufferWindowMemory]" = OrderedDict()
+        self._memories_lock = threading.Lock()
+        # Bumped whenever the vector store changes (part of the coalescing key)
+        self._local_version = 0
         
-        # Initialize LLM and memory
+        # Initialize LLM
         self._initialize_llm()
-        self._initialize_memory()
     
     def _initialize_llm(self):
-        """Initialize Gemini LLM"""
+        """Initialize the async Gemini client (deadlines, retries, hedging)"""
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
-            google_api_key=api_key,
+        self.llm_provider = GeminiProvider(
+            api_key=api_key,
             temperature=0.7,
             max_output_tokens=1200  # Reduced for faster responses
         )
     
-    def _initialize_memory(self):
-        """Initialize conversation memory"""
-        self.memory = ConversationBufferWindowMemory(
+    def _new_memory(self) -> ConversationBufferWindowMemory:
+        """Create a conversation memory for one chat session"""
+        from langchain.memory import ConversationBufferWindowMemory
+        
+        return ConversationBufferWindowMemory(
             k=3,  # Reduced conversation history for faster processing
             memory_key="chat_history",
             return_messages=True,
             output_key="answer"
         )
     
+    def get_chat_history(self, session_id: Optional[str]) -> list:
+        """Recent messages of a session (empty for anonymous/new sessions)"""
+        if not session_id:
+            return []
+        with self._memories_lock:
+            memory = self.memories.get(session_id)
+            if memory is None:
+                return []
+            self.memories.move_to_end(session_id)
+            return list(memory.load_memory_variables({})["chat_history"])
+    
+    def remember(self, session_id: Optional[str], question: str, answer: str) -> int:
+        """Record an exchange in the session memory and return the conversation length"""
+        if not session_id:
+            return 1
+        with self._memories_lock:
+            memory = self.memories.get(session_id)
+            if memory is None:
+                memory = self._new_memory()
+                self.memories[session_id] = memory
+            self.memories.move_to_end(session_id)
+            memory.save_context({"question": question}, {"answer": answer})
+            
+            while len(self.memories) > MAX_SESSION_MEMORIES:
+                self.memories.popitem(last=False)
+            return len(memory.chat_memory.messages) // 2
+    
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text from PDF using PyMuPDF"""
-        if not os.path.exists(pdf_path):
-            return ""
-        
-        doc = fitz.open(pdf_path)
-        text = ""
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            page_text = page.get_text()
-            
-            if page_text.strip():
-                text += f"\n\n--- Lecture Page {page_num + 1} ---\n\n"
-                text += page_text
-        
-        doc.close()
-        return text
+        return ingestion.extract_text_from_pdf(pdf_path)
     
-    def create_overlapping_chunks(self, text: str, chunk_size: int = 800, chunk_overlap: int = 100) -> List[Document]:
+    def create_overlapping_chunks(self, text: str, chunk_size: int = ingestion.DEFAULT_CHUNK_SIZE,
+                                  chunk_overlap: int = ingestion.DEFAULT_CHUNK_OVERLAP) -> List[Document]:
         """Split text into overlapping chunks (smaller chunks for faster processing)"""
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        
-        chunks = text_splitter.split_text(text)
-        
-        documents = []
-        for i, chunk in enumerate(chunks):
-            doc = Document(
-                page_content=chunk,
-                metadata={
-                    "chunk_id": i,
-                    "source": "Unknown",
-                    "chunk_size": len(chunk),
-                    "content_type": "lecture_notes"
-                }
-            )
-            documents.append(doc)
-        
-        return documents
+        return ingestion.create_overlapping_chunks(text, chunk_size, chunk_overlap)
     
     def process_pdfs(self, pdf_paths: List[str]) -> List[Document]:
         """Process multiple PDF files and create document chunks"""
-        extracted_texts = {}
-        
+        documents = []
         for pdf_path in pdf_paths:
             if os.path.exists(pdf_path):
-                text = self.extract_text_from_pdf(pdf_path)
-                extracted_texts[os.path.basename(pdf_path)] = text
+                documents.extend(ingestion.chunk_pdf(pdf_path))
         
-        documents = []
-        for source, text in extracted_texts.items():
-            docs = self.create_overlapping_chunks(text)
-            for doc in docs:
-                doc.metadata["source"] = source
-            documents.extend(docs)
+        # Reused slides across decks become one chunk with all their locations
+        if ingestion.DEDUP_ENABLED:
+            documents = ingestion.deduplicate_chunks(documents)
         
         return documents
     
+    async def build_summaries(self, pdf_paths: List[str], replace: bool = False) -> Dict[str, int]:
+        """Generate per-document and per-section summaries for the given PDFs"""
+        return await self.summaries.build(pdf_paths, self.llm_provider, replace=replace)
+    
+    def summary_answer(self, question: str) -> Optional[Dict]:
+        """Answer a summary-style question from precomputed summaries (None when not applicable)"""
+        return self.summaries.answer(question)
+    
+    @property
+    def collection_version(self) -> str:
+        """Changes whenever the indexed content changes (in any worker for the shared index)"""
+        if self.shared_index is not None:
+            self.shared_index.maybe_reload()
+            return self.shared_index.version
+        return str(self._local_version)
+    
+    def _publish_shared(self, documents: List[Document], append: bool,
+                        metadata_updates: Optional[Dict[str, Dict]] = None):
+        """Embed documents and publish them as a new shared index generation"""
+        vectors = self.embedding_model.embed_documents([doc.page_content for doc in documents])
+        records = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+        self.shared_index.publish(vectors, records, append=append, metadata_updates=metadata_updates)
+    
     def create_vectorstore(self, documents: List[Document]):
         """Create ChromaDB vector store"""
         if not documents:
             return
         
+        if self.shared_index is not None:
+            self._publish_shared(documents, append=False)
+            self.vectorstore = self.shared_index
+            self._setup_retriever()
+            return
+        
+        from langchain_community.vectorstores import Chroma
+        
         self.vectorstore = Chroma.from_documents(
             documents=documents,
             embedding=self.embedding_model,
@@ -132,107 +207,144 @@ class RAGService:
         )
         
         self.vectorstore.persist()
-        self._setup_retriever_and_chain()
+        self._local_version += 1
+        if HIERARCHICAL_ENABLED:
+            self._build_routing()
+        self._setup_retriever()
+    
+    def _build_routing(self):
+        """Build the document/section routing level from the Chroma collection and save it"""
+        data = self.vectorstore._collection.get(include=["embeddings", "metadatas"])
+        metadatas = [metadata or {} for metadata in data["metadatas"]]
+        self.routing = RoutingIndex.build(
+            data["embeddings"],
+            [metadata.get("source", "Unknown") for metadata in metadatas],
+            [int(metadata.get("chunk_id", 0)) for metadata in metadatas]
+        )
+        self.routing.save(os.path.join(self.persist_directory, "routing.npz"))
+        print(f"Built routing index: {self.routing.stats()}")
     
     def load_vectorstore(self) -> bool:
         """Load existing vector store from disk"""
+        if self.shared_index is not None:
+            if not self.shared_index.maybe_reload():
+                return False
+            self.vectorstore = self.shared_index
+            self._setup_retriever()
+            return True
+        
         if os.path.exists(self.persist_directory):
+            from langchain_community.vectorstores import Chroma
+            
             self.vectorstore = Chroma(
                 persist_directory=self.persist_directory,
                 embedding_function=self.embedding_model,
                 collection_name="software_engineering_knowledge_base"
             )
-            self._setup_retriever_and_chain()
+            if HIERARCHICAL_ENABLED:
+                routing_path = os.path.join(self.persist_directory, "routing.npz")
+                if os.path.exists(routing_path):
+                    self.routing = RoutingIndex.load(routing_path)
+                else:
+                    self._build_routing()
+            self._setup_retriever()
             return True
         return False
     
-    def add_to_vectorstore(self, documents: List[Document]):
-        """Add documents to existing vector store"""
+    def _stored_chunks(self) -> Tuple[List[Tuple[str, Dict]], List[str]]:
+        """(text, metadata) of every indexed chunk, plus Chroma ids (empty for the shared index)"""
+        if self.shared_index is not None:
+            return [
+                (record["page_content"], record["metadata"])
+                for record in self.shared_index.all_records()
+            ], []
+        data = self.vectorstore._collection.get(include=["documents", "metadatas"])
+        return [
+            (text, metadata or {}) for text, metadata in zip(data["documents"], data["metadatas"])
+        ], data["ids"]
+    
+    def add_to_vectorstore(self, documents: List[Document]) -> int:
+        """Add documents to existing vector store. Returns the number of chunks added."""
         if not self.vectorstore:
             raise ValueError("Vector store not initialized")
         
-        self.vectorstore.add_documents(documents)
+        metadata_updates: Dict[str, Dict] = {}
+        if ingestion.DEDUP_ENABLED:
+            # Chunks repeating content that is already indexed only add their locations
+            stored, ids = self._stored_chunks()
+            documents, metadata_updates = ingestion.deduplicate_against_stored(documents, stored)
+            if metadata_updates and ids:
+                updated = [
+                    (chunk_id, metadata_updates[ingestion.chunk_key(metadata)])
+                    for chunk_id, (_, metadata) in zip(ids, stored)
+                    if ingestion.chunk_key(metadata) in metadata_updates
+                ]
+                self.vectorstore._collection.update(
+                    ids=[chunk_id for chunk_id, _ in updated],
+                    metadatas=[metadata for _, metadata in updated]
+                )
+        
+        if self.shared_index is not None:
+            if documents or metadata_updates:
+                self._publish_shared(documents, append=True, metadata_updates=metadata_updates)
+            return len(documents)
+        
+        if documents:
+            self.vectorstore.add_documents(documents)
         self.vectorstore.persist()
+        self._local_version += 1
+        if HIERARCHICAL_ENABLED:
+            self._build_routing()
+            self._setup_retriever()
+        return len(documents)
     
-    def _setup_retriever_and_chain(self):
-        """Setup retriever and RAG chain"""
+    def _setup_retriever(self):
+        """Setup the retriever for the current vector store"""
         if not self.vectorstore:
             return
         
-        # Create retriever
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",  # Faster than similarity_score_threshold
-            search_kwargs={
-                "k": 5  # Reduced from 5 for faster retrieval
-            }
-        )
+        from shared_index import make_shared_retriever
         
-        # Create RAG chain
-        qa_prompt_template = """You are an expert assistant for software engineering courses such as Distributed Systems, Software Metrics, and related subjects.
-
-You will be given a QUESTION and some CONTEXT extracted from course materials (lecture notes, slides, PDFs, textbooks).
-
-Instructions:
-- Always use the CONTEXT as the starting point of your answer.  
-- If the CONTEXT provides only names, terms, or short points, then expand each one in detail using your own knowledge (definitions, purpose, examples, pros/cons).  
-- If the CONTEXT provides some explanation but not enough detail, merge the given explanation with your own knowledge to produce a richer, more complete answer.  
-- If the CONTEXT is completely empty or irrelevant, say:  
-  "Dont say you dont have in context.  
-- Always explain thoroughly, not in one line. Use structured formats:
-  - Definitions (if applicable)  
-  - Key points or steps  
-  - Additional elaboration/examples from your knowledge  
-- Make sure the answer is clear, detailed, and student-friendly for exam preparation.
-
----
-
-CONTEXT:
-{context}
-
-QUESTION:
-{question}
-
-ANSWER:
-zna-jeny-ihn"""
-
-        qa_prompt = PromptTemplate(
-            template=qa_prompt_template,
-            input_variables=["context", "question"]
-        )
-        
-        self.rag_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.retriever,
-            memory=self.memory,
-            return_source_documents=True,
-            combine_docs_chain_kwargs={"prompt": qa_prompt},
-            verbose=False
-        )
+        # Create retriever
+        if self.shared_index is not None:
+            self.retriever = make_shared_retriever(self.shared_index, self.embedding_model, k=RETRIEVAL_K)
+        elif HIERARCHICAL_ENABLED and self.routing is not None:
+            self.retriever = make_hierarchical_retriever(
+                self.vectorstore, self.routing, self.embedding_model, k=RETRIEVAL_K
+            )
+        else:
+            self.retriever = self.vectorstore.as_retriever(
+                search_type="similarity",  # Faster than similarity_score_threshold
+                search_kwargs={
+                    "k": RETRIEVAL_K
+                }
+            )
     
-    def ask_question(self, question: str) -> Dict:
-        """Ask a question to the RAG chatbot"""
-        if not self.rag_chain:
-            raise ValueError("RAG chain not initialized")
-        
-        result = self.rag_chain({"question": question})
-        
-        sources = []
-        source_documents = result.get('source_documents', [])
-        
-        # If no source documents in result, manually retrieve them
-        if not source_documents and self.retriever:
-            print("No sources in chain result, manually retrieving...")
-            source_documents = self.retriever.get_relevant_documents(question)
-        
+    def coalesce_key(self, question: str, chat_history: list) -> str:
+        """Key identifying requests that must produce the same answer"""
+        normalized = re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+        history = "\n".join(f"{message.type}:{message.content}" for message in chat_history)
+        raw = f"{self.collection_version}\x00{normalized}\x00{history}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _format_sources(self, source_documents: List[Document]) -> List[Dict]:
+        """Convert retrieved documents into source references"""
         print(f"Found {len(source_documents)} source documents")
         
+        sources = []
         for i, doc in enumerate(source_documents):
-            print(f"Document {i}: {doc.metadata}")
-            sources.append({
+            source = {
                 "source": doc.metadata.get('source', 'Unknown'),
                 "chunk_id": str(doc.metadata.get('chunk_id', i)),
                 "content_preview": doc.page_content[:100] + "..." if len(doc.page_content) > 100 else doc.page_content
-            })
+            }
+            # Collapsed near-duplicates list every place the passage appears
+            if doc.metadata.get('locations'):
+                source["locations"] = [
+                    f"{location['source']} (page {location['page']})" if "page" in location else location["source"]
+                    for location in json.loads(doc.metadata['locations'])
+                ]
+            sources.append(source)
         
         # If still no sources found, add a message
         if not sources:
@@ -241,17 +353,157 @@ zna-jeny-ihn"""
                 "chunk_id": "N/A",
                 "content_preview": "No relevant documents were found in the knowledge base for this question."
             })
+        return sources
+    
+    def _format_history(self, chat_history: list) -> str:
+        return "\n".join(
+            f"{'Human' if message.type == 'human' else 'Assistant'}: {message.content}"
+            for message in chat_history
+        )
+    
+    async def _aprepare(self, question: str, chat_history: list) -> Tuple[str, List[Document]]:
+        """Condense a follow-up question, retrieve context and build the answer prompt"""
+        if not self.retriever:
+            raise ValueError("Retriever not initialized")
+        
+        standalone_question = question
+        if chat_history:
+            standalone_question = (await self.llm_provider.generate(
+                CONDENSE_QUESTION_TEMPLATE.format(
+                    chat_history=self._format_history(chat_history), question=question
+                )
+            )).strip() or question
         
+        # Retrieval is CPU bound (embedding + vector search), keep it off the event loop
+        source_documents = await asyncio.to_thread(self.retriever.get_relevant_documents, standalone_question)
+        return self._build_prompt(standalone_question, source_documents), source_documents
+    
+    def _build_prompt(self, question: str, source_documents: List[Document]) -> str:
+        context = "\n\n".join(doc.page_content for doc in source_documents)
+        return QA_PROMPT_TEMPLATE.format(context=context, question=question)
+    
+    async def aanswer_question(self, question: str, chat_history: Optional[list] = None) -> Dict:
+        """Answer a question given the prior chat history (does not touch session memory)"""
+        prompt, source_documents = await self._aprepare(question, chat_history or [])
+        answer = await self.llm_provider.generate(prompt)
         return {
-            "answer": result['answer'],
-            "sources": sources,
-            "conversation_length": len(self.memory.chat_memory.messages) // 2 if self.memory else 0
+            "answer": answer,
+            "sources": self._format_sources(source_documents)
+        }
+    
+    def retrieve_batch(self, questions: List[str]) -> List[List[Document]]:
+        """Retrieve context for many standalone questions at once.
+        
+        All questions are embedded in one batch and searched with a single
+        matrix query instead of one embedding pass and search per question.
+        """
+        if not self.vectorstore:
+            raise ValueError("Vector store not initialized")
+        
+        from langchain.schema import Document
+        
+        query_vectors = self.embedding_model.embed_documents(questions)
+        
+        if self.shared_index is not None:
+            # Records come back with the hits, resolved against the generation that was searched
+            return [
+                [
+                    Document(page_content=record["page_content"], metadata={**record["metadata"], "score": score})
+                    for record, score in hits
+                ]
+                for hits in self.shared_index.search_batch(query_vectors, RETRIEVAL_K)
+            ]
+        
+        if HIERARCHICAL_ENABLED and self.routing is not None:
+            # Each question searches only the chunks of its own routed lectures
+            return [
+                search_routed(self.vectorstore, self.routing, query_vector, RETRIEVAL_K)
+                for query_vector in query_vectors
+            ]
+        
+        # Chroma answers a list of query embeddings in one call
+        results = self.vectorstore._collection.query(
+            query_embeddings=query_vectors,
+            n_results=RETRIEVAL_K,
+            include=["documents", "metadatas"]
+        )
+        return [
+            [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(texts, metadatas)
+            ]
+            for texts, metadatas in zip(results["documents"], results["metadatas"])
+        ]
+    
+    async def aanswer_with_context(self, question: str, source_documents: List[Document]) -> Dict:
+        """Answer a standalone question from already retrieved documents"""
+        if not self.retriever:
+            raise ValueError("Retriever not initialized")
+        answer = await self.llm_provider.generate(self._build_prompt(question, source_documents))
+        return {
+            "answer": answer,
+            "sources": self._format_sources(source_documents)
+        }
+    
+    async def astream_answer(self, question: str, chat_history: Optional[list] = None) -> AsyncIterator[Tuple[str, object]]:
+        """Stream an answer as ("token", text) events followed by one ("sources", list) event"""
+        prompt, source_documents = await self._aprepare(question, chat_history or [])
+        async for text in self.llm_provider.stream(prompt):
+            yield "token", text
+        yield "sources", self._format_sources(source_documents)
+    
+    def memory_usage(self) -> Dict[str, object]:
+        """Approximate memory held by each RAG component (for admin diagnostics)"""
+        embedding = {"model": None, "parameter_bytes": None}
+        client = getattr(self.embedding_model, "client", None)
+        if client is not None and hasattr(client, "parameters"):
+            embedding["model"] = type(client).__name__
+            embedding["parameter_bytes"] = sum(
+                tensor.numel() * tensor.element_size()
+                for tensor in list(client.parameters()) + list(client.buffers())
+            )
+        
+        if self.shared_index is not None:
+            vector_store = {"type": "shared_index", **self.shared_index.stats()}
+        else:
+            disk_bytes = sum(
+                os.path.getsize(os.path.join(directory, name))
+                for directory, _, names in os.walk(self.persist_directory) for name in names
+            ) if os.path.exists(self.persist_directory) else 0
+            vector_store = {
+                "type": "chroma",
+                "count": self.get_document_count(),
+                "disk_bytes": disk_bytes,
+                "routing": self.routing.stats() if self.routing is not None else None
+            }
+        
+        with self._memories_lock:
+            messages = [message for memory in self.memories.values() for message in memory.chat_memory.messages]
+            memories = {
+                "sessions": len(self.memories),
+                "max_sessions": MAX_SESSION_MEMORIES,
+                "messages": len(messages),
+                "text_bytes": sum(len(str(message.content).encode("utf-8")) for message in messages)
+            }
+        
+        summaries = self.summaries.maybe_reload()
+        return {
+            "embedding_model": embedding,
+            "vector_store": vector_store,
+            "conversation_memories": memories,
+            "summaries": {
+                "documents": len(summaries),
+                "bytes": os.path.getsize(self.summaries.documents_path) if summaries else 0
+            }
         }
     
     def get_document_count(self) -> int:
         """Get total number of documents in vector store"""
         if not self.vectorstore:
             return 0
+        if self.shared_index is not None:
+            self.shared_index.maybe_reload()
+            return self.shared_index.count
         try:
             collection = self.vectorstore._collection
             return collection.count()
@@ -0,0 +1,476 @@
+# Shared vector index - memory-mapped snapshots readable by many worker processes
+import os
+import json
+import fcntl
+import hashlib
+import shutil
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from hierarchy import HIERARCHICAL_ENABLED, HIERARCHY_FANOUT, RoutingIndex
+from ingestion import chunk_key
+
+# Set to a directory to serve vectors from memory-mapped snapshots instead of Chroma
+SHARED_INDEX_DIR = os.getenv("RAG_SHARED_INDEX_DIR", "")
+# Older generations kept on disk for readers that have not remapped yet
+KEEP_GENERATIONS = int(os.getenv("RAG_SHARED_INDEX_KEEP", "2"))
+# Verify file checksums from the manifest when mapping a generation
+VERIFY_CHECKSUMS = os.getenv("RAG_VERIFY_SNAPSHOT", "false").lower() == "true"
+
+# "int8" scans 1-byte scalar-quantized codes and re-scores the best candidates
+# with the float32 vectors; "none" scans the float32 vectors directly
+QUANTIZATION = os.getenv("RAG_INDEX_QUANTIZATION", "none").lower()
+# Candidates re-scored in full precision, as a multiple of k
+RESCORE_FACTOR = int(os.getenv("RAG_QUANTIZED_RESCORE_FACTOR", "4"))
+# Rows dequantized at a time while scanning codes (bounds temporary memory)
+SCAN_BLOCK_ROWS = 65536
+
+# Bump when the on-disk layout changes incompatibly
+FORMAT_VERSION = 1
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_FOLDER = "./models_cache"
+
+_embedding_model = None
+_embedding_lock = threading.Lock()
+
+def get_embedding_model():
+    """Process-wide embedding model.
+
+    Loaded once per process; under gunicorn with preload_app the master loads
+    it before forking so workers share the weights copy-on-write.
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_lock:
+            if _embedding_model is None:
+                from langchain_community.embeddings import SentenceTransformerEmbeddings
+                _embedding_model = SentenceTransformerEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME,
+                    cache_folder=EMBEDDING_CACHE_FOLDER  # Cache models locally
+                )
+    return _embedding_model
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-dimension scalar quantization: vectors ~= codes * scales"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return np.zeros(vectors.shape, dtype=np.int8), np.ones(vectors.shape[-1:], dtype=np.float32)
+    scales = np.abs(vectors).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def quantized_search(codes: np.ndarray, scales: np.ndarray, vectors: np.ndarray, queries: np.ndarray,
+                     k: int, rescore_factor: int = RESCORE_FACTOR) -> List[List[Tuple[int, float]]]:
+    """Top-k rows per (normalised) query: approximate scan over int8 codes, exact re-score.
+
+    Only the codes are read in full; the float32 vectors are touched for the
+    few candidate rows of each query, so a memory-mapped vectors file stays
+    mostly out of RAM.
+    """
+    rows = len(codes)
+    scaled_queries = (queries * scales).T  # folding the scales into the query keeps codes integral
+    approx = np.empty((rows, len(queries)), dtype=np.float32)
+    for start in range(0, rows, SCAN_BLOCK_ROWS):
+        block = np.asarray(codes[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+        approx[start:start + len(block)] = block @ scaled_queries
+
+    k = min(k, rows)
+    candidates = min(rows, max(k, k * rescore_factor))
+    top = np.argpartition(-approx, candidates - 1, axis=0)[:candidates]
+    results = []
+    for column in range(len(queries)):
+        # Sorted rows read the mapped file front to back
+        candidate_rows = np.sort(top[:, column])
+        exact = np.asarray(vectors[candidate_rows], dtype=np.float32) @ queries[column]
+        order = np.argsort(-exact)[:k]
+        results.append([(int(candidate_rows[i]), float(exact[i])) for i in order])
+    return results
+
+class _Generation:
+    """Arrays of one mapped generation.
+
+    Never mutated: a remap swaps in a new object, so a search that took a
+    reference resolves its rows against the same records it scored.
+    """
+
+    def __init__(self, name: str, manifest: Dict[str, Any], vectors: np.ndarray, offsets: np.ndarray,
+                 records: Optional[np.memmap], codes: Optional[np.ndarray], scales: Optional[np.ndarray],
+                 routing: Optional[RoutingIndex]):
+        self.name, self.manifest = name, manifest
+        self.vectors, self.offsets, self.records = vectors, offsets, records
+        self.codes, self.scales, self.routing = codes, scales, routing
+
+    @property
+    def count(self) -> int:
+        return int(self.manifest.get("count", 0))
+
+    def record(self, row: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(bytes(self.records[start:end]).decode("utf-8"))
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Top-k (row, score) for normalised queries with a single matrix multiplication"""
+        if HIERARCHICAL_ENABLED and self.routing is not None and self.routing.row_starts is not None:
+            return self._search_routed(queries, k, HIERARCHY_FANOUT)
+        if self.codes is not None:
+            return quantized_search(self.codes, self.scales, self.vectors, queries, k)
+        scores = self.vectors @ queries.T  # (rows, queries)
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        results = []
+        for column in range(scores.shape[1]):
+            rows = top[:, column]
+            rows = rows[np.argsort(-scores[rows, column])]
+            results.append([(int(row), float(scores[row, column])) for row in rows])
+        return results
+
+    def _search_routed(self, queries: np.ndarray, k: int, fanout: int) -> List[List[Tuple[int, float]]]:
+        """Two-stage search: pick documents by section vectors, then search only their rows"""
+        row_starts = self.routing.row_starts
+        row_ends = np.append(row_starts[1:], self.count)
+        results = []
+        for column, documents in enumerate(self.routing.select(queries, fanout)):
+            query = queries[column]
+            hits = []
+            for document in documents:
+                start, end = int(row_starts[document]), int(row_ends[document])
+                if self.codes is not None:
+                    part = quantized_search(self.codes[start:end], self.scales, self.vectors[start:end],
+                                            query[None, :], k)[0]
+                else:
+                    scores = np.asarray(self.vectors[start:end]) @ query
+                    top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+                    part = [(int(row), float(scores[row])) for row in top]
+                hits.extend((start + row, score) for row, score in part)
+            hits.sort(key=lambda hit: hit[1], reverse=True)
+            results.append(hits[:k])
+        return results
+
+class SharedVectorIndex:
+    """Vector index stored as immutable, memory-mapped generations.
+
+    Layout of the index directory:
+        CURRENT               name of the live generation
+        .writer.lock          held by the single process allowed to publish
+        gen-000001/
+            manifest.json     format version, counts, dimension, embedding model,
+                              file sizes and checksums (+ builder details)
+            vectors.npy       float32, L2-normalised, one row per chunk
+            codes.npy         int8 scalar-quantized vectors (RAG_INDEX_QUANTIZATION=int8)
+            scales.npy        float32 per-dimension scales of the codes
+            routing.npz       section vectors and document row ranges for
+                              hierarchical retrieval (see hierarchy.py)
+            records.bin       UTF-8 JSON records (page_content + metadata)
+            offsets.npy       int64 byte offsets into records.bin (rows + 1)
+            lexical.json      optional lexical statistics (see build_index.py)
+
+    Every worker maps the same files read-only, so the page cache holds one
+    copy no matter how many workers there are. A writer builds a complete new
+    generation next to the live one and switches CURRENT with an atomic
+    rename; readers notice the change on their next query and remap.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        # Swapped as a whole on remap (see _Generation)
+        self._live: Optional[_Generation] = None
+        self._current_stamp = None
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    # ---- reading -------------------------------------------------------
+
+    @property
+    def current_path(self) -> str:
+        return os.path.join(self.root, "CURRENT")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.current_path)
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(self.current_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def maybe_reload(self) -> bool:
+        """Remap if another process published a new generation. Returns True if loaded."""
+        try:
+            stat = os.stat(self.current_path)
+        except FileNotFoundError:
+            return False
+        # CURRENT is replaced by rename, so a new inode means a new generation
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._current_stamp and self._live is not None:
+            return True
+
+        with self._lock:
+            generation = self._read_current()
+            if generation is None:
+                return False
+            if generation != self.generation:
+                self._map(generation)
+            self._current_stamp = stamp
+        return True
+
+    def _map(self, generation: str):
+        path = os.path.join(self.root, generation)
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        self._validate(path, manifest)
+
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        records_path = os.path.join(path, "records.bin")
+        records = np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else None
+
+        codes = scales = None
+        codes_path = os.path.join(path, "codes.npy")
+        if QUANTIZATION == "int8" and os.path.exists(codes_path):
+            codes = np.load(codes_path, mmap_mode="r")
+            scales = np.load(os.path.join(path, "scales.npy"))
+
+        routing_path = os.path.join(path, "routing.npz")
+        routing = RoutingIndex.load(routing_path) if os.path.exists(routing_path) else None
+
+        self._live = _Generation(generation, manifest, vectors, offsets, records, codes, scales, routing)
+        print(f"Mapped shared index generation {generation} ({manifest['count']} vectors"
+              f"{', int8 codes' if codes is not None else ''})")
+
+    def _validate(self, path: str, manifest: Dict[str, Any]):
+        if manifest.get("format_version", FORMAT_VERSION) > FORMAT_VERSION:
+            raise ValueError(f"Index {path} uses a newer format ({manifest['format_version']})")
+        if manifest.get("embedding_model") != EMBEDDING_MODEL_NAME:
+            raise ValueError(
+                f"Index {path} was built with {manifest.get('embedding_model')}, "
+                f"this server embeds queries with {EMBEDDING_MODEL_NAME}"
+            )
+        if VERIFY_CHECKSUMS:
+            for name, info in manifest.get("files", {}).items():
+                if file_sha256(os.path.join(path, name)) != info["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {name} in {path}")
+
+    def read_file(self, name: str) -> Optional[bytes]:
+        """Read an auxiliary file (e.g. lexical.json) of the live generation"""
+        if not self.maybe_reload():
+            return None
+        try:
+            with open(os.path.join(self.root, self._live.name, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @property
+    def generation(self) -> Optional[str]:
+        return self._live.name if self._live is not None else None
+
+    @property
+    def count(self) -> int:
+        return self._live.count if self._live is not None else 0
+
+    @property
+    def version(self) -> str:
+        return self.generation or "empty"
+
+    def stats(self) -> Dict[str, Any]:
+        """Size of the data every query scans versus the full-precision vectors"""
+        live = self._live
+        if live is None:
+            return {"generation": "empty", "count": 0, "quantization": "none", "scanned_bytes": 0,
+                    "vector_bytes": 0, "record_bytes": 0, "routing": None}
+        full_bytes = int(live.vectors.nbytes)
+        scanned_bytes = int(live.codes.nbytes + live.scales.nbytes) if live.codes is not None else full_bytes
+        return {
+            "generation": live.name,
+            "count": live.count,
+            "quantization": "int8" if live.codes is not None else "none",
+            "scanned_bytes": scanned_bytes,
+            "vector_bytes": full_bytes,
+            "record_bytes": int(live.records.nbytes) if live.records is not None else 0,
+            "routing": live.routing.stats() if live.routing is not None else None
+        }
+
+    def all_records(self) -> List[Dict[str, Any]]:
+        """Every record of the live generation"""
+        if not self.maybe_reload():
+            return []
+        live = self._live
+        return [live.record(row) for row in range(live.count)]
+
+    def search(self, query_vector: List[float], k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Top-k (record, score) by cosine similarity"""
+        return self.search_batch([query_vector], k)[0]
+
+    def search_batch(self, query_vectors: List[List[float]], k: int) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """Top-k (record, score) for many queries, all resolved against one generation"""
+        if not self.maybe_reload():
+            return [[] for _ in query_vectors]
+        live = self._live
+        if live.count == 0:
+            return [[] for _ in query_vectors]
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1))
+        return [
+            [(live.record(row), score) for row, score in hits]
+            for hits in live.search(queries, k)
+        ]
+
+    # ---- writing -------------------------------------------------------
+
+    @contextmanager
+    def writer_lock(self):
+        """Exclusive cross-process lock: only one process publishes at a time"""
+        with open(os.path.join(self.root, ".writer.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _next_generation(self) -> str:
+        existing = [name for name in os.listdir(self.root) if name.startswith("gen-")]
+        number = max([int(name[4:]) for name in existing] or [0]) + 1
+        return f"gen-{number:06d}"
+
+    def publish(self, vectors: np.ndarray, records: List[Dict[str, Any]], append: bool = False,
+                extra_manifest: Optional[Dict[str, Any]] = None,
+                extra_files: Optional[Dict[str, bytes]] = None,
+                metadata_updates: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """Write a new generation (optionally appending to the live one) and make it current.
+
+        `metadata_updates` replaces the metadata of appended-to records by
+        ingestion.chunk_key (e.g. locations of duplicates that were not added).
+        """
+        with self.writer_lock():
+            self.maybe_reload()
+            live = self._live
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if records:
+                vectors = _normalize(vectors.reshape(len(records), -1))
+            elif live is not None and live.count:
+                # Metadata-only update of the live records
+                vectors = np.zeros((0, live.vectors.shape[1]), dtype=np.float32)
+
+            if append and live is not None and live.count:
+                old_records = [live.record(row) for row in range(live.count)]
+                for record in old_records:
+                    record["metadata"] = (metadata_updates or {}).get(chunk_key(record["metadata"]),
+                                                                      record["metadata"])
+                vectors = np.concatenate([np.asarray(live.vectors), vectors])
+                records = old_records + records
+
+            # Keep each document's chunks contiguous so routed searches scan row ranges
+            sources = [record["metadata"].get("source", "Unknown") for record in records]
+            first_seen: Dict[str, int] = {}
+            for source in sources:
+                first_seen.setdefault(source, len(first_seen))
+            order = sorted(range(len(records)), key=lambda row: first_seen[sources[row]])
+            vectors = vectors[order]
+            records = [records[row] for row in order]
+            sources = [sources[row] for row in order]
+
+            generation = self._next_generation()
+            tmp_path = os.path.join(self.root, f".tmp-{generation}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+
+            offsets = [0]
+            with open(os.path.join(tmp_path, "records.bin"), "wb") as f:
+                for record in records:
+                    data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+                    f.write(data)
+                    offsets.append(offsets[-1] + len(data))
+                f.flush()
+                os.fsync(f.fileno())
+            np.save(os.path.join(tmp_path, "vectors.npy"), vectors)
+            # Always written (a quarter of the vectors' size) so nodes can switch quantization freely
+            codes, scales = quantize_int8(vectors)
+            np.save(os.path.join(tmp_path, "codes.npy"), codes)
+            np.save(os.path.join(tmp_path, "scales.npy"), scales)
+            if records:
+                routing = RoutingIndex.build(vectors, sources, range(len(records)))
+                chunks_per_document = Counter(sources)
+                counts = [chunks_per_document[document] for document in routing.documents]
+                routing.row_starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+                routing.save(os.path.join(tmp_path, "routing.npz"))
+            np.save(os.path.join(tmp_path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+            for name, data in (extra_files or {}).items():
+                with open(os.path.join(tmp_path, name), "wb") as f:
+                    f.write(data)
+
+            files = {
+                name: {"bytes": os.path.getsize(os.path.join(tmp_path, name)),
+                       "sha256": file_sha256(os.path.join(tmp_path, name))}
+                for name in sorted(os.listdir(tmp_path))
+            }
+            manifest = {
+                "format_version": FORMAT_VERSION,
+                "generation": generation,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "count": len(records),
+                "dimension": int(vectors.shape[1]) if len(records) else 0,
+                "embedding_model": EMBEDDING_MODEL_NAME,
+                "files": files,
+                **(extra_manifest or {})
+            }
+            with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=2)
+
+            os.rename(tmp_path, os.path.join(self.root, generation))
+            self._switch_current(generation)
+            self._prune()
+
+        self.maybe_reload()
+        return generation
+
+    def _switch_current(self, generation: str):
+        tmp_current = self.current_path + ".tmp"
+        with open(tmp_current, "w") as f:
+            f.write(generation)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_current, self.current_path)
+
+    def _prune(self):
+        # Readers still mapping a removed generation keep working: unlinked
+        # files stay valid until they are unmapped
+        generations = sorted(name for name in os.listdir(self.root) if name.startswith("gen-"))
+        for name in generations[:-KEEP_GENERATIONS]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+def make_shared_retriever(index: SharedVectorIndex, embedding_model, k: int):
+    """LangChain retriever over a SharedVectorIndex"""
+    from langchain_core.retrievers import BaseRetriever
+    from langchain.schema import Document
+
+    class SharedIndexRetriever(BaseRetriever):
+        index: Any
+        embedding: Any
+        k: int = 5
+
+        def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+            return [
+                Document(page_content=record["page_content"], metadata={**record["metadata"], "score": score})
+                for record, score in self.index.search(self.embedding.embed_query(query), self.k)
+            ]
+
+    return SharedIndexRetriever(index=index, embedding=embedding_model, k=k)
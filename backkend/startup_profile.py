@@ -0,0 +1,60 @@
+# Startup profile - timings of import and startup phases
+#
+# Import this module first in main.py. Each phase is recorded relative to the
+# moment this module was imported; interpreter start-up before that is read
+# from /proc when available. For a per-module breakdown of import cost run:
+#   python -X importtime -c "import main"
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+PROFILE_START = time.perf_counter()
+_phases: List[Dict[str, object]] = []
+
+def _interpreter_startup_ms() -> Optional[float]:
+    """Time between process creation and this module being imported (Linux only)"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round((uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+INTERPRETER_STARTUP_MS = _interpreter_startup_ms()
+
+def since_start_ms() -> float:
+    return round((time.perf_counter() - PROFILE_START) * 1000, 1)
+
+@contextmanager
+def phase(name: str):
+    """Record how long the enclosed block takes"""
+    started = time.perf_counter()
+    entry = {"phase": name, "started_ms": since_start_ms(), "duration_ms": None}
+    _phases.append(entry)
+    try:
+        yield
+    finally:
+        entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+def mark(name: str):
+    """Record an instant (e.g. "ready")"""
+    _phases.append({"phase": name, "started_ms": since_start_ms(), "duration_ms": 0.0})
+
+def report() -> Dict[str, object]:
+    return {
+        "interpreter_startup_ms": INTERPRETER_STARTUP_MS,
+        "since_start_ms": since_start_ms(),
+        "phases": list(_phases)
+    }
+
+def log_report():
+    print("Startup profile:")
+    if INTERPRETER_STARTUP_MS is not None:
+        print(f"  {'interpreter (before main)':<28} {INTERPRETER_STARTUP_MS:>9.1f} ms")
+    for entry in _phases:
+        duration = entry["duration_ms"]
+        duration = "running" if duration is None else f"{duration:.1f} ms"
+        print(f"  {entry['phase']:<28} {duration:>12}  (at {entry['started_ms']:.1f} ms)")
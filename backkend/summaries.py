@@ -0,0 +1,386 @@
+# Precomputed lecture summaries - per-document and per-section summaries and key concepts
+#
+# Built after ingestion, map-reduce style: every section (a run of consecutive
+# pages) is summarised by the LLM with bounded concurrency, then the section
+# summaries are reduced into one document summary. Each LLM result is cached
+# by the hash of its input, so re-running over unchanged PDFs costs nothing
+# and a changed PDF only regenerates the sections whose text changed.
+#
+# Usage (offline):
+#   python summaries.py assets/ --output ./summaries --concurrency 4
+# or set RAG_SUMMARIES=true to build them after /init-db and /add-pdf.
+#
+# /ask answers summary-style questions ("summarize lecture 5", "key points of
+# greedy algorithms") straight from these artifacts without retrieval or an
+# LLM call.
+from __future__ import annotations
+
+import os
+import re
+import sys
+import json
+import glob
+import fcntl
+import asyncio
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import ingestion
+
+if TYPE_CHECKING:
+    from llm_provider import GeminiProvider
+
+SUMMARIES_ENABLED = os.getenv("RAG_SUMMARIES", "false").lower() == "true"
+SUMMARY_DIR = os.getenv("RAG_SUMMARY_DIR", "./summaries")
+# Parallel LLM calls while building (kept low: this competes with live traffic)
+SUMMARY_CONCURRENCY = int(os.getenv("RAG_SUMMARY_CONCURRENCY", "4"))
+# Approximate characters of slide text per section
+SECTION_CHARS = int(os.getenv("RAG_SUMMARY_SECTION_CHARS", "6000"))
+
+# Bump when the prompts change so cached results are regenerated
+PROMPT_VERSION = 1
+
+SECTION_PROMPT = """You are preparing exam study material from course lecture slides.
+
+Summarize the following excerpt of "{source}" (pages {first_page}-{last_page}).
+Respond with JSON only, exactly in this form:
+{{"title": "short section title", "summary": "4-6 sentence summary", "concepts": ["Concept: one line explanation"]}}
+List at most 8 key concepts.
+
+EXCERPT:
+{text}
+"""
+
+DOCUMENT_PROMPT = """You are preparing exam study material from course lecture slides.
+
+Below are summaries of consecutive sections of "{source}".
+Write an overall summary of the whole lecture.
+Respond with JSON only, exactly in this form:
+{{"title": "lecture title", "summary": "one or two paragraph summary", "concepts": ["Concept: one line explanation"]}}
+List at most 12 key concepts.
+
+SECTION SUMMARIES:
+{sections}
+"""
+
+# Questions asking for an overview rather than a specific fact
+SUMMARY_QUESTION = re.compile(
+    r"\b(summar(y|ies|ise|ize)|overview|outline|recap|"
+    r"(key|main|important) (points?|concepts?|ideas?|topics?|takeaways?))\b",
+    re.IGNORECASE
+)
+_LECTURE_NUMBER = re.compile(r"\blec\w*\s*#?\s*0*(\d+)\b", re.IGNORECASE)
+# Words that say nothing about which lecture is meant
+_STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "for", "to", "and", "about", "from", "me", "give", "please",
+    "what", "are", "is", "was", "lecture", "lectures", "slides", "chapter", "topic", "topics",
+    "summary", "summarize", "summarise", "summaries", "overview", "outline", "recap", "key",
+    "main", "important", "point", "points", "concept", "concepts", "idea", "ideas", "takeaways",
+    "takeaway", "section", "this", "that", "all", "covered", "explain", "list", "pdf"
+}
+# Share of the question's topic words a document or section must contain
+MIN_TOPIC_COVERAGE = 0.5
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+def _topic_words(text: str) -> set:
+    # Split CamelCase file names ("GreedyAlgorithms") before tokenizing
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return {token for token in ingestion.tokenize(text) if token not in _STOPWORDS and not token.isdigit()}
+
+def split_sections(pages: List[Tuple[int, str]], section_chars: int = SECTION_CHARS) -> List[Dict]:
+    """Group consecutive pages into sections of roughly section_chars characters"""
+    sections, current = [], []
+    for page_number, text in pages:
+        if current and sum(len(page_text) for _, page_text in current) + len(text) > section_chars:
+            sections.append(current)
+            current = []
+        current.append((page_number, text))
+    if current:
+        sections.append(current)
+    return [
+        {
+            "first_page": section[0][0],
+            "last_page": section[-1][0],
+            "text": "\n".join(page_text for _, page_text in section)
+        }
+        for section in sections
+    ]
+
+def parse_summary(text: str) -> Dict:
+    """Read the JSON object an LLM was asked for, tolerating code fences and chatter"""
+    start, end = text.find("{"), text.rfind("}")
+    if start >= 0 and end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+            return {
+                "title": str(data.get("title", "")).strip(),
+                "summary": str(data.get("summary", "")).strip(),
+                "concepts": [str(concept).strip() for concept in data.get("concepts", []) if str(concept).strip()]
+            }
+        except (ValueError, AttributeError):
+            pass
+    return {"title": "", "summary": text.strip(), "concepts": []}
+
+class SummaryStore:
+    """Summaries on disk, shared by every worker process.
+
+    Layout:
+        documents.json    source file name -> document summary with its sections
+        .lock             held while documents.json is rewritten
+        cache/<sha>.json  one cached LLM result per input hash
+    """
+
+    def __init__(self, root: str = SUMMARY_DIR):
+        self.root = root
+        self.documents: Dict[str, Dict] = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    @property
+    def documents_path(self) -> str:
+        return os.path.join(self.root, "documents.json")
+
+    # ---- reading -------------------------------------------------------
+
+    def maybe_reload(self) -> Dict[str, Dict]:
+        """Current documents, re-read when another process has rewritten them"""
+        try:
+            stat = os.stat(self.documents_path)
+        except FileNotFoundError:
+            return self.documents
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._stamp:
+            with self._lock:
+                with open(self.documents_path) as f:
+                    self.documents = json.load(f)
+                self._stamp = stamp
+        return self.documents
+
+    def match(self, question: str) -> Optional[Tuple[Dict, Optional[Dict]]]:
+        """(document, section or None) a summary-style question refers to, if any"""
+        if not SUMMARY_QUESTION.search(question):
+            return None
+        documents = list(self.maybe_reload().values())
+        if not documents:
+            return None
+
+        words = _topic_words(question)
+        number = _LECTURE_NUMBER.search(question)
+        if number:
+            # "lecture 5" -> documents whose file name carries that number
+            wanted = int(number.group(1))
+            numbered = [
+                document for document in documents
+                if any(int(found) == wanted for found in _LECTURE_NUMBER.findall(document["source"]))
+            ]
+            if len(numbered) == 1:
+                return numbered[0], None
+            if not numbered:
+                return None
+            documents = numbered
+
+        if not words:
+            return None
+
+        # Topic match against document and section titles, file names and concepts
+        candidates = []
+        for document in documents:
+            document_words = _topic_words(" ".join(
+                [os.path.splitext(document["source"])[0], document["title"]] + document["concepts"]
+            ))
+            candidates.append((len(words & document_words) / len(words), 1, document, None))
+            for section in document.get("sections", []):
+                section_words = _topic_words(" ".join([section["title"]] + section["concepts"]))
+                candidates.append((len(words & section_words) / len(words), 0, document, section))
+
+        candidates.sort(key=lambda candidate: (candidate[0], candidate[1]), reverse=True)
+        best = candidates[0]
+        if best[0] < MIN_TOPIC_COVERAGE:
+            return None
+        # Two different lectures matching equally well is ambiguous: let retrieval handle it
+        runner_up = next((candidate for candidate in candidates[1:] if candidate[2] is not best[2]), None)
+        if runner_up and runner_up[0] == best[0]:
+            return None
+        return best[2], best[3]
+
+    def answer(self, question: str) -> Optional[Dict]:
+        """Answer and sources from a precomputed summary, or None to use retrieval"""
+        matched = self.match(question)
+        if matched is None:
+            return None
+        document, section = matched
+        item = section or document
+        pages = f", pages {item['first_page']}-{item['last_page']}" if section else ""
+
+        parts = [f"**{item['title'] or document['source']}** ({document['source']}{pages})", item["summary"]]
+        if item["concepts"]:
+            parts.append("**Key concepts:**\n" + "\n".join(f"- {concept}" for concept in item["concepts"]))
+        if section is None and document.get("sections"):
+            parts.append("**Sections:**\n" + "\n".join(
+                f"- Pages {entry['first_page']}-{entry['last_page']}: {entry['title']}"
+                for entry in document["sections"]
+            ))
+        preview = item["summary"]
+        return {
+            "answer": "\n\n".join(parts),
+            "sources": [{
+                "source": document["source"],
+                "chunk_id": f"summary:{item['first_page']}-{item['last_page']}" if section else "summary",
+                "content_preview": preview[:100] + "..." if len(preview) > 100 else preview
+            }]
+        }
+
+    # ---- building ------------------------------------------------------
+
+    @contextmanager
+    def _writer_lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.root, "cache", f"{key}.json")
+
+    async def _cached_generate(self, key: str, prompt: str, provider: GeminiProvider,
+                               semaphore: asyncio.Semaphore) -> Dict:
+        path = self._cache_path(key)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        async with semaphore:
+            result = parse_summary(await provider.generate(prompt))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+        return result
+
+    async def _summarize_document(self, pdf_path: str, provider: GeminiProvider,
+                                  semaphore: asyncio.Semaphore) -> Optional[Dict]:
+        source = os.path.basename(pdf_path)
+        pages = await asyncio.to_thread(ingestion.extract_pages, pdf_path)
+        if not pages:
+            return None
+        sections = split_sections(pages)
+
+        # Map: sections in parallel (bounded by the semaphore)
+        results = await asyncio.gather(*[
+            self._cached_generate(
+                _hash(str(PROMPT_VERSION), provider.model, "section", source, section["text"]),
+                SECTION_PROMPT.format(source=source, **section),
+                provider,
+                semaphore
+            )
+            for section in sections
+        ])
+        section_entries = [
+            {
+                "first_page": section["first_page"],
+                "last_page": section["last_page"],
+                "title": result["title"] or f"Pages {section['first_page']}-{section['last_page']}",
+                "summary": result["summary"],
+                "concepts": result["concepts"]
+            }
+            for section, result in zip(sections, results)
+        ]
+
+        # Reduce: one summary of the section summaries
+        if len(section_entries) == 1:
+            overall = dict(results[0])
+        else:
+            digest = "\n\n".join(
+                f"[Pages {entry['first_page']}-{entry['last_page']}] {entry['title']}\n{entry['summary']}\n"
+                + "\n".join(f"- {concept}" for concept in entry["concepts"])
+                for entry in section_entries
+            )
+            overall = await self._cached_generate(
+                _hash(str(PROMPT_VERSION), provider.model, "document", source, digest),
+                DOCUMENT_PROMPT.format(source=source, sections=digest),
+                provider,
+                semaphore
+            )
+
+        return {
+            "source": source,
+            "title": overall["title"] or os.path.splitext(source)[0],
+            "summary": overall["summary"],
+            "concepts": overall["concepts"],
+            "first_page": pages[0][0],
+            "last_page": pages[-1][0],
+            "sections": section_entries,
+            "generated_at": datetime.utcnow().isoformat() + "Z"
+        }
+
+    async def build(self, pdf_paths: List[str], provider: GeminiProvider,
+                    concurrency: int = SUMMARY_CONCURRENCY, replace: bool = False) -> Dict[str, int]:
+        """Summarize PDFs and merge them into documents.json (or replace it); returns counts"""
+        semaphore = asyncio.Semaphore(concurrency)
+        pdf_paths = [path for path in pdf_paths if os.path.exists(path)]
+        results = await asyncio.gather(
+            *[self._summarize_document(path, provider, semaphore) for path in pdf_paths],
+            return_exceptions=True
+        )
+
+        built, failed = {}, 0
+        for path, result in zip(pdf_paths, results):
+            if isinstance(result, Exception):
+                failed += 1
+                print(f"Summary generation failed for {os.path.basename(path)}: {result}")
+            elif result is not None:
+                built[result["source"]] = result
+
+        with self._writer_lock():
+            # Merge with what other processes may have written meanwhile
+            documents = {}
+            if not replace and os.path.exists(self.documents_path):
+                with open(self.documents_path) as f:
+                    documents = json.load(f)
+            documents.update(built)
+            tmp_path = self.documents_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(documents, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.documents_path)
+
+        self.maybe_reload()
+        print(f"Summaries built for {len(built)} documents ({failed} failed)")
+        return {"documents": len(built), "failed": failed}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute lecture summaries and key concepts")
+    parser.add_argument("pdfs", nargs="+", help="PDF files or directories containing PDFs")
+    parser.add_argument("--output", default=SUMMARY_DIR, help=f"Summary directory (default: {SUMMARY_DIR})")
+    parser.add_argument("--concurrency", type=int, default=SUMMARY_CONCURRENCY, help="Parallel LLM calls")
+    return parser.parse_args(argv)
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from llm_provider import GeminiProvider
+
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise SystemExit("GEMINI_API_KEY not found in environment variables")
+
+    pdf_paths = []
+    for path in args.pdfs:
+        pdf_paths.extend(sorted(glob.glob(os.path.join(path, "*.pdf"))) if os.path.isdir(path) else [path])
+
+    provider = GeminiProvider(api_key=api_key, temperature=0.2, max_output_tokens=1200)
+    try:
+        await SummaryStore(args.output).build(pdf_paths, provider, args.concurrency)
+    finally:
+        await provider.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(_main(parse_args(sys.argv[1:])))
@@ -0,0 +1,5 @@
+# Backend modules are imported flat (as uvicorn main:app does from backkend/)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
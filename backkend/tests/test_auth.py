@@ -0,0 +1,19 @@
+import asyncio
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+
+def test_optional_user_id_comes_from_the_token_without_a_database_lookup(monkeypatch):
+    async def unreachable(*args, **kwargs):
+        raise AssertionError("hot endpoints must not look the user up")
+
+    monkeypatch.setattr(auth.user_db, "get_user_by_id", unreachable)
+    token = auth.create_access_token({"sub": "64b7f0c2a1e4d3b2c1a09f8e"})
+
+    def user_id(credentials):
+        return asyncio.run(auth.get_optional_user_id(credentials))
+
+    assert user_id(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)) == "64b7f0c2a1e4d3b2c1a09f8e"
+    assert user_id(HTTPAuthorizationCredentials(scheme="Bearer", credentials="not-a-jwt")) is None
+    assert user_id(None) is None
@@ -0,0 +1,31 @@
+import asyncio
+import gc
+
+from coalesce import SingleFlightStream
+
+def test_stream_flight_keeps_its_producer_alive_until_it_finishes():
+    flights = SingleFlightStream()
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def produce(flight):
+            flight.publish(("token", "a"))
+            await release.wait()
+            flight.publish(("token", "b"))
+
+        flight = flights.join("key", produce)
+        assert flights.join("key", produce) is flight
+        await asyncio.sleep(0)
+        gc.collect()
+        assert flight.task is not None and not flight.task.done()
+
+        release.set()
+        events = [event async for event in flight.subscribe()]
+        return flight, events
+
+    flight, events = asyncio.run(scenario())
+
+    assert events == [("token", "a"), ("token", "b")]
+    assert flight.task is None
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 1}
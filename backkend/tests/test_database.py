@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import database
+from database import DatabaseUnavailableError, IndexSetupError
+
+class _Collection:
+    def __init__(self, error=None):
+        self.error = error
+        self.inserted = []
+
+    async def create_indexes(self, indexes):
+        if self.error:
+            raise self.error
+
+    async def insert_one(self, document):
+        self.inserted.append(document)
+
+class _Database(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, _Collection())
+
+def test_failed_email_index_is_fatal():
+    duplicate_emails = OperationFailure("E11000 duplicate key error", code=11000)
+    mongo = _Database(users=_Collection(duplicate_emails))
+
+    with pytest.raises(IndexSetupError):
+        asyncio.run(database.ensure_indexes(mongo))
+
+def test_failed_optional_index_is_only_logged():
+    mongo = _Database(chat_messages=_Collection(OperationFailure("index build aborted")))
+
+    asyncio.run(database.ensure_indexes(mongo))
+
+def test_signup_is_refused_until_the_email_index_exists(monkeypatch):
+    mongo = _Database()
+    monkeypatch.setattr(database.db, "database", mongo)
+    monkeypatch.setattr(database.db, "indexes_ready", False)
+
+    with pytest.raises(DatabaseUnavailableError):
+        asyncio.run(database.user_db.create_user("a@example.com", "hash"))
+    with pytest.raises(DatabaseUnavailableError):
+        asyncio.run(database.user_db.update_user("64b7f0c2a1e4d3b2c1a09f8e", {"email": "b@example.com"}))
+    assert mongo["users"].inserted == []
@@ -0,0 +1,34 @@
+import threading
+
+from diagnostics import SamplingProfiler
+
+class _Settings:
+    def __init__(self):
+        self.stopped = False
+
+    def get(self):
+        # Real work in a function that shares its name with Queue.get
+        total = 0
+        while not self.stopped:
+            total += sum(range(1000))
+        return total
+
+def test_idle_filter_drops_parked_threads_but_keeps_work_named_like_them():
+    stop = threading.Event()
+    settings = _Settings()
+    busy = threading.Thread(target=settings.get, name="busy-get")
+    parked = threading.Thread(target=stop.wait, name="parked")
+    busy.start()
+    parked.start()
+    try:
+        stacks, samples = SamplingProfiler().sample(seconds=0.3, interval=0.01)
+    finally:
+        settings.stopped = True
+        stop.set()
+        busy.join()
+        parked.join()
+
+    threads = {stack.split(";")[0] for stack in stacks}
+    assert samples > 0
+    assert "busy-get" in threads
+    assert "parked" not in threads
@@ -0,0 +1,22 @@
+import numpy as np
+
+from hierarchy import RoutingIndex
+
+def test_build_accepts_nested_lists():
+    # chromadb 0.4.x returns _collection.get(include=["embeddings"]) as list of lists
+    vectors = [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]
+    routing = RoutingIndex.build(vectors, ["a.pdf", "a.pdf", "b.pdf"], [0, 1, 0], section_chunks=8)
+
+    assert routing.documents == ["a.pdf", "b.pdf"]
+    assert routing.section_vectors.shape == (2, 2)
+    assert routing.select(np.asarray([[0.0, 1.0]], dtype=np.float32), fanout=1) == [[1]]
+
+def test_build_empty_collection(tmp_path):
+    routing = RoutingIndex.build([], [], [])
+
+    assert routing.stats() == {"documents": 0, "sections": 0}
+    assert routing.select(np.asarray([[1.0, 0.0]], dtype=np.float32)) == [[]]
+
+    path = str(tmp_path / "routing.npz")
+    routing.save(path)
+    assert RoutingIndex.load(path).stats() == {"documents": 0, "sections": 0}
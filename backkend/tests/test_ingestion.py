@@ -0,0 +1,93 @@
+import json
+import random
+
+import ingestion
+
+WORDS = [f"term{i}" for i in range(5000)]
+
+def _text(rng: random.Random, words: int = 130) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def test_neighbouring_chunks_with_low_overlap_survive():
+    # Overlapping windows of one long text, like create_overlapping_chunks produces
+    rng = random.Random(0)
+    words = _text(rng, 6000).split()
+    chunks = [" ".join(words[start:start + 130]) for start in range(0, len(words) - 130, 120)]
+
+    groups = ingestion.find_near_duplicates(chunks, threshold=0.8)
+
+    assert len(groups) == len(chunks)
+
+def test_unrelated_chunks_survive():
+    rng = random.Random(1)
+    chunks = [_text(rng) for _ in range(300)]
+
+    assert len(ingestion.find_near_duplicates(chunks, threshold=0.8)) == 300
+
+def test_near_duplicates_collapse_to_longest():
+    rng = random.Random(2)
+    original = _text(rng, 200)
+    edited = original.replace(original.split()[100], "changed", 1)
+    longer = original + " appendix"
+    chunks = [original, _text(rng), edited, longer]
+
+    groups = ingestion.find_near_duplicates(chunks, threshold=0.8)
+
+    assert sorted(map(sorted, groups)) == [[0, 2, 3], [1]]
+    assert [group for group in groups if len(group) == 3][0][0] == 3
+
+def test_cluster_members_meet_threshold_against_canonical():
+    # A chain of small edits: each step is a near duplicate of the previous one,
+    # but the ends of the chain are not near duplicates of each other
+    rng = random.Random(3)
+    words = _text(rng, 200).split()
+    chain = []
+    for step in range(8):
+        words = words[10:] + _text(rng, 10).split()
+        chain.append(" ".join(words))
+
+    groups = ingestion.find_near_duplicates(chain, threshold=0.8)
+
+    for group in groups:
+        canonical = ingestion._shingle_hashes(chain[group[0]])
+        for member in group[1:]:
+            shingles = ingestion._shingle_hashes(chain[member])
+            assert len(canonical & shingles) / len(canonical | shingles) >= 0.8
+
+class _Chunk:
+    """Stands in for a LangChain Document (page_content + metadata)"""
+
+    def __init__(self, page_content: str, metadata: dict):
+        self.page_content = page_content
+        self.metadata = metadata
+
+def test_new_chunks_duplicating_stored_ones_only_add_locations():
+    rng = random.Random(4)
+    slide = _text(rng, 200)
+    stored = [
+        (slide, {"source": "Lecture 01.pdf", "chunk_id": 3, "page": 4, "page_end": 4}),
+        (_text(rng), {"source": "Lecture 01.pdf", "chunk_id": 4, "page": 5, "page_end": 5}),
+    ]
+    new = [
+        _Chunk(slide + " again", {"source": "Lecture 02.pdf", "chunk_id": 0, "page": 2, "page_end": 2}),
+        _Chunk(_text(rng), {"source": "Lecture 02.pdf", "chunk_id": 1, "page": 3, "page_end": 3}),
+    ]
+
+    kept, updates = ingestion.deduplicate_against_stored(new, stored, threshold=0.8)
+
+    assert [chunk.metadata["chunk_id"] for chunk in kept] == [1]
+    merged = updates["Lecture 01.pdf#3"]
+    assert merged["duplicates"] == 1
+    assert [location["source"] for location in json.loads(merged["locations"])] == [
+        "Lecture 01.pdf", "Lecture 02.pdf"
+    ]
+
+def test_merging_keeps_locations_of_earlier_merges():
+    first = ingestion.merge_duplicate_metadata([
+        {"source": "a.pdf", "chunk_id": 0, "page": 1},
+        {"source": "b.pdf", "chunk_id": 0, "page": 1},
+    ])
+    merged = ingestion.merge_duplicate_metadata([first, {"source": "c.pdf", "chunk_id": 2, "page": 7}])
+
+    assert merged["duplicates"] == 2
+    assert [location["source"] for location in json.loads(merged["locations"])] == ["a.pdf", "b.pdf", "c.pdf"]
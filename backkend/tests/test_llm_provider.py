@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+
+import fake_gemini_server
+import llm_provider
+from llm_provider import GeminiProvider, LLMOverloadedError, TransientLLMError
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """GeminiProvider talking to fake_gemini_server in process"""
+    monkeypatch.setattr(fake_gemini_server, "LATENCY", 0.0)
+    monkeypatch.setattr(fake_gemini_server, "JITTER", 0.0)
+    monkeypatch.setattr(fake_gemini_server, "ERROR_RATE", 0.0)
+    monkeypatch.setattr(llm_provider, "LLM_RETRY_BACKOFF", 0.0)
+
+    provider = GeminiProvider(api_key="test", base_url="http://fake-gemini/v1beta", timeout=5, max_retries=2)
+    monkeypatch.setattr(provider, "_get_client", lambda: httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=fake_gemini_server.app)
+    ))
+    return provider
+
+def _stream(provider):
+    async def collect():
+        return "".join([text async for text in provider.stream("question")])
+    return asyncio.run(collect())
+
+def test_generate_and_stream_answer(fake_gemini):
+    assert asyncio.run(fake_gemini.generate("question")).startswith("Fake answer")
+    assert _stream(fake_gemini).startswith("Fake answer")
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_exhausted_overload_retries_raise_overloaded(fake_gemini, monkeypatch, status):
+    monkeypatch.setattr(fake_gemini_server, "ERROR_RATE", 1.0)
+    monkeypatch.setattr(fake_gemini_server, "ERROR_STATUS", status)
+
+    with pytest.raises(LLMOverloadedError) as generate_error:
+        asyncio.run(fake_gemini.generate("question"))
+    with pytest.raises(LLMOverloadedError) as stream_error:
+        _stream(fake_gemini)
+
+    assert generate_error.value.retry_after == stream_error.value.retry_after == 7
+    assert fake_gemini.metrics.retries == 4
+
+def test_deadline_is_a_timeout_not_an_overload(fake_gemini, monkeypatch):
+    monkeypatch.setattr(fake_gemini_server, "LATENCY", 1.0)
+
+    with pytest.raises(TransientLLMError) as error:
+        asyncio.run(fake_gemini.generate("question", timeout=0.1))
+
+    assert not isinstance(error.value, LLMOverloadedError)
+    assert fake_gemini.metrics.timeouts == 1
+
+def test_client_of_a_previous_event_loop_is_closed(monkeypatch):
+    monkeypatch.setattr(fake_gemini_server, "LATENCY", 0.0)
+    monkeypatch.setattr(fake_gemini_server, "JITTER", 0.0)
+    monkeypatch.setattr(fake_gemini_server, "ERROR_RATE", 0.0)
+    async_client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **options: async_client(
+        transport=httpx.ASGITransport(app=fake_gemini_server.app), **options
+    ))
+    provider = GeminiProvider(api_key="test", base_url="http://fake-gemini/v1beta")
+
+    first_loop = asyncio.new_event_loop()
+    try:
+        first_loop.run_until_complete(provider.generate("question"))
+        first_client = provider._client
+
+        asyncio.run(provider.generate("question"))
+        # The close was scheduled on the loop that owns the client's connections
+        first_loop.run_until_complete(asyncio.sleep(0.01))
+    finally:
+        first_loop.close()
+
+    assert first_client.is_closed
+    assert provider._client is not first_client
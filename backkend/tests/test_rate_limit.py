@@ -0,0 +1,41 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import rate_limit
+from rate_limit import InMemoryRateLimitBackend, RateLimit
+
+def test_eviction_keeps_active_buckets_of_strict_limits(monkeypatch):
+    backend = InMemoryRateLimitBackend(max_keys=100)
+    strict = RateLimit.parse("1/hour")
+    fast = RateLimit.parse("1000/second")
+
+    async def scenario():
+        assert (await backend.acquire("init_db:user:1", strict))[0]
+        # A burst of many keys on a fast endpoint forces eviction
+        for client in range(500):
+            await backend.acquire(f"ask:ip:{client}", fast)
+        return await backend.acquire("init_db:user:1", strict)
+
+    # 10 ms pass per request: the fast buckets are full again on the next one
+    clock = itertools.count()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: next(clock) * 0.01))
+    allowed, retry_after = asyncio.run(scenario())
+
+    assert not allowed
+    assert retry_after > 0
+    assert len(backend.buckets) <= 100
+
+def test_least_recently_used_buckets_go_first_when_all_are_active():
+    backend = InMemoryRateLimitBackend(max_keys=10)
+    strict = RateLimit.parse("1/hour")
+
+    async def scenario():
+        for client in range(11):
+            await backend.acquire(f"key:{client}", strict)
+
+    asyncio.run(scenario())
+
+    assert len(backend.buckets) <= 10
+    assert "key:0" not in backend.buckets
+    assert "key:10" in backend.buckets
@@ -0,0 +1,51 @@
+import numpy as np
+
+import shared_index
+from shared_index import SharedVectorIndex
+
+def _corpus(prefix: str, count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, 16)).astype(np.float32)
+    records = [
+        {"page_content": f"{prefix}-{row}", "metadata": {"source": f"{prefix}.pdf", "chunk_id": row}}
+        for row in range(count)
+    ]
+    return vectors, records
+
+def test_search_returns_records_of_the_generation_it_searched(tmp_path, monkeypatch):
+    writer = SharedVectorIndex(str(tmp_path))
+    reader = SharedVectorIndex(str(tmp_path))
+    old_vectors, old_records = _corpus("old", 20, seed=0)
+    writer.publish(old_vectors, old_records)
+    assert reader.maybe_reload()
+
+    new_vectors, new_records = _corpus("new", 5, seed=1)
+    original_search = shared_index._Generation.search
+
+    def search_then_remap(generation, queries, k):
+        hits = original_search(generation, queries, k)
+        # Another request publishes and remaps between scoring and reading records
+        writer.publish(new_vectors, new_records)
+        assert reader.maybe_reload()
+        return hits
+
+    monkeypatch.setattr(shared_index._Generation, "search", search_then_remap)
+    hits = reader.search(old_vectors[17].tolist(), k=10)
+
+    assert len(hits) == 10
+    assert all(record["page_content"].startswith("old-") for record, _ in hits)
+    assert hits[0][0]["page_content"] == "old-17"
+    assert reader.count == 5
+
+def test_append_applies_metadata_updates_to_stored_records(tmp_path):
+    index = SharedVectorIndex(str(tmp_path))
+    vectors, records = _corpus("old", 4, seed=2)
+    index.publish(vectors, records)
+
+    updates = {"old.pdf#2": {**records[2]["metadata"], "locations": "[]", "duplicates": 1}}
+    index.publish(np.zeros((0, 16), dtype=np.float32), [], append=True, metadata_updates=updates)
+
+    stored = {record["metadata"]["chunk_id"]: record["metadata"] for record in index.all_records()}
+    assert index.count == 4
+    assert stored[2]["duplicates"] == 1
+    assert "duplicates" not in stored[1]
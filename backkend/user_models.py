@@ -1,6 +1,6 @@
 # User Authentication Models
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 class UserSignupRequest(BaseModel):
@@ -26,6 +26,15 @@ class UserResponse(BaseModel):
     created_at: datetime
     last_login: Optional[datetime] = None
 
+class UserListResponse(BaseModel):
+    users: List[UserResponse]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+class UserCountResponse(BaseModel):
+    count: int
+    estimated: bool
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
@@ -1,15 +1,18 @@
 # User Authentication Routes
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query, status
+from fastapi.responses import StreamingResponse
 from datetime import timedelta
+from typing import Optional
 from user_models import (
-    UserSignupRequest, UserLoginRequest, UserResponse, 
+    UserSignupRequest, UserLoginRequest, UserResponse, UserListResponse, UserCountResponse,
     TokenResponse, UserUpdateRequest, ChangePasswordRequest, MessageResponse
 )
 from auth import (
     get_password_hash, verify_password, create_access_token,
-    get_current_user, get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES
+    get_current_active_user, get_admin_user, ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from database import user_db
+from database import user_db, DB_UNAVAILABLE_ERRORS
+from http_responses import json_dumps
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -21,40 +24,19 @@ async def signup(user_data: UserSignupRequest):
     try:
         print(f"Attempting to create user with email: {user_data.email}")
         
-        # Check if user already exists
-        existing_user = await user_db.get_user_by_email(user_data.email)
-        if existing_user:
-            print(f"User already exists: {user_data.email}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
-        print("User doesn't exist, proceeding with creation...")
-        
         # Hash password
         hashed_password = get_password_hash(user_data.password)
         print("Password hashed successfully")
         
-        # Create user
-        user_id = await user_db.create_user(
+        # Create user (the unique email index rejects existing accounts)
+        user = await user_db.create_user(
             email=user_data.email,
             hashed_password=hashed_password,
             full_name=user_data.full_name
         )
+        user_id = user["_id"]
         print(f"User created with ID: {user_id}")
         
-        # Get created user
-        user = await user_db.get_user_by_id(user_id)
-        if not user:
-            print("Failed to retrieve created user")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create user"
-            )
-        
-        print("User retrieved successfully")
-        
         # Create access token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
@@ -62,10 +44,6 @@ async def signup(user_data: UserSignupRequest):
         )
         print("Access token created")
         
-        # Update last login
-        await user_db.update_last_login(user_id)
-        print("Last login updated")
-        
         # Prepare user response (remove sensitive data)
         user_response = UserResponse(
             id=user["_id"],
@@ -89,6 +67,8 @@ async def signup(user_data: UserSignupRequest):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    except DB_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         print(f"Unexpected error: {e}")
         import traceback
@@ -99,13 +79,13 @@ async def signup(user_data: UserSignupRequest):
         )
 
 @router.post("/login", response_model=TokenResponse)
-async def login(user_credentials: UserLoginRequest):
+async def login(user_credentials: UserLoginRequest, background_tasks: BackgroundTasks):
     """
     Authenticate user and return access token
     """
     try:
-        # Get user by email
-        user = await user_db.get_user_by_email(user_credentials.email)
+        # Get user by email (single indexed lookup, hash included for verification)
+        user = await user_db.get_user_by_email(user_credentials.email, include_password=True)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -132,8 +112,8 @@ async def login(user_credentials: UserLoginRequest):
             data={"sub": user["_id"]}, expires_delta=access_token_expires
         )
         
-        # Update last login
-        await user_db.update_last_login(user["_id"])
+        # Update last login after the response is sent
+        background_tasks.add_task(user_db.update_last_login, user["_id"])
         
         # Prepare user response
         user_response = UserResponse(
@@ -153,6 +133,8 @@ async def login(user_credentials: UserLoginRequest):
         
     except HTTPException:
         raise
+    except DB_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -188,25 +170,18 @@ async def update_current_user(
             update_data["full_name"] = user_update.full_name
         
         if user_update.email is not None:
-            # Check if new email already exists
-            existing_user = await user_db.get_user_by_email(user_update.email)
-            if existing_user and existing_user["_id"] != current_user["_id"]:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email already registered"
-                )
             update_data["email"] = user_update.email
         
         if update_data:
-            success = await user_db.update_user(current_user["_id"], update_data)
-            if not success:
+            # The unique email index rejects addresses owned by another account
+            updated_user = await user_db.update_user(current_user["_id"], update_data)
+            if not updated_user:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Failed to update user"
                 )
-        
-        # Get updated user
-        updated_user = await user_db.get_user_by_id(current_user["_id"])
+        else:
+            updated_user = current_user
         
         return UserResponse(
             id=updated_user["_id"],
@@ -217,8 +192,15 @@ async def update_current_user(
             last_login=updated_user.get("last_login")
         )
         
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     except HTTPException:
         raise
+    except DB_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -234,8 +216,11 @@ async def change_password(
     Change user password
     """
     try:
+        # The authenticated user is loaded without the hash, so fetch it here
+        user = await user_db.get_user_by_id(current_user["_id"], include_password=True)
+        
         # Verify current password
-        if not verify_password(password_data.current_password, current_user["hashed_password"]):
+        if not user or not verify_password(password_data.current_password, user["hashed_password"]):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Current password is incorrect"
@@ -260,6 +245,8 @@ async def change_password(
         
     except HTTPException:
         raise
+    except DB_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -274,30 +261,89 @@ async def logout(current_user: dict = Depends(get_current_active_user)):
     return MessageResponse(message="Logged out successfully")
 
 # Admin routes (optional)
-@router.get("/users", response_model=list[UserResponse])
+def _user_response(user: dict) -> UserResponse:
+    return UserResponse(
+        id=user["_id"],
+        email=user["email"],
+        full_name=user.get("full_name"),
+        is_active=user["is_active"],
+        created_at=user["created_at"],
+        last_login=user.get("last_login")
+    )
+
+@router.get("/users", response_model=UserListResponse)
 async def get_all_users(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: dict = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    include_total: bool = False,
+    current_user: dict = Depends(get_admin_user)
 ):
     """
-    Get all users (admin only - you can add admin check later)
+    Get all users (admin only)
+    Pass the returned next_cursor back as `cursor` to fetch the following page.
     """
     try:
-        users = await user_db.get_all_users(skip=skip, limit=limit)
-        return [
-            UserResponse(
-                id=user["_id"],
-                email=user["email"],
-                full_name=user.get("full_name"),
-                is_active=user["is_active"],
-                created_at=user["created_at"],
-                last_login=user.get("last_login")
-            )
-            for user in users
-        ]
+        users, next_cursor = await user_db.get_users_page(after=cursor, limit=limit)
+        total = await user_db.count_users(estimated=True) if include_total else None
+        return UserListResponse(
+            users=[_user_response(user) for user in users],
+            next_cursor=next_cursor,
+            total=total
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except DB_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch users"
         )
+
+@router.get("/users/export")
+async def export_users(current_user: dict = Depends(get_admin_user)):
+    """
+    Stream all users as NDJSON (one JSON object per line, admin only)
+    """
+    async def generate():
+        async for user in user_db.iter_users():
+            user_response = _user_response(user)
+            yield json_dumps({
+                "id": user_response.id,
+                "email": user_response.email,
+                "full_name": user_response.full_name,
+                "is_active": user_response.is_active,
+                "created_at": user_response.created_at.isoformat(),
+                "last_login": user_response.last_login.isoformat() if user_response.last_login else None
+            }) + "\n"
+    
+    # Fail fast with 503 before the stream starts if the database is down
+    user_db.get_collection()
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=users.ndjson"}
+    )
+
+@router.get("/users/count", response_model=UserCountResponse)
+async def count_users(
+    exact: bool = False,
+    current_user: dict = Depends(get_admin_user)
+):
+    """
+    Count users (estimated and cached unless exact=true, admin only)
+    """
+    try:
+        count = await user_db.count_users(estimated=not exact)
+        return UserCountResponse(count=count, estimated=not exact)
+    except DB_UNAVAILABLE_ERRORS:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to count users"
+        )